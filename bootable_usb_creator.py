@@ -10,6 +10,9 @@ import sys
 import subprocess
 import json
 import threading
+import hashlib
+import re
+import sqlite3
 from pathlib import Path
 from typing import List, Dict, Optional
 import tkinter as tk
@@ -18,16 +21,1342 @@ from tkinter import ttk, filedialog, messagebox, scrolledtext
 
 class USBDevice:
     """Represents a USB storage device"""
-    def __init__(self, device: str, size: str, model: str, mountpoint: str = ""):
+    def __init__(self, device: str, size: str, model: str, mountpoint: str = "",
+                 serial: str = "", bus: str = "", controller: str = ""):
         self.device = device
         self.size = size
         self.model = model
         self.mountpoint = mountpoint
+        self.serial = serial
+        # sysfs paths of the USB root hub (shared bandwidth) and its host controller
+        self.bus = bus
+        self.controller = controller
     
     def __str__(self):
         return f"{self.device} - {self.model} ({self.size})"
 
 
+def usb_topology(name: str) -> tuple:
+    """Return the sysfs (root hub, host controller) paths a block device hangs off"""
+    # e.g. /sys/devices/pci0000:00/0000:00:14.0/usb2/2-1/2-1.3/2-1.3:1.0/host6/.../block/sdb
+    parts = os.path.realpath(f"/sys/block/{name}").split('/')
+    for i, part in enumerate(parts):
+        if re.match(r'^usb\d+$', part):
+            return '/'.join(parts[:i + 1]), '/'.join(parts[:i])
+    return "", ""
+
+
+def scan_usb_devices() -> List[USBDevice]:
+    """Get list of USB storage devices from lsblk"""
+    # Use lsblk to get block devices
+    result = subprocess.run(
+        ['lsblk', '-J', '-o', 'NAME,SIZE,MODEL,SERIAL,TRAN,TYPE,MOUNTPOINT'],
+        capture_output=True, text=True, check=True
+    )
+    
+    data = json.loads(result.stdout)
+    devices = []
+    
+    for device in data.get('blockdevices', []):
+        # Filter for USB devices
+        if device.get('tran') == 'usb' and device.get('type') == 'disk':
+            dev_path = f"/dev/{device['name']}"
+            size = device.get('size', 'Unknown')
+            model = (device.get('model') or 'Unknown').strip()
+            mountpoint = device.get('mountpoint', '')
+            serial = (device.get('serial') or '').strip()
+            bus, controller = usb_topology(device['name'])
+            
+            devices.append(USBDevice(dev_path, size, model, mountpoint, serial, bus, controller))
+    
+    return devices
+
+
+# Multiboot layout: a small FAT32 boot partition holding GRUB for UEFI and
+# Legacy BIOS, followed by a data partition holding the ISO files, the
+# manifest describing them and the generated GRUB menu.
+MULTIBOOT_ESP_LABEL = "MBOOT_EFI"
+MULTIBOOT_ESP_SIZE = "257MiB"
+MULTIBOOT_DIR = "multiboot"
+MULTIBOOT_ISO_DIR = "isos"
+MULTIBOOT_MANIFEST = "multiboot/isos.json"
+MULTIBOOT_GRUB_CFG = "multiboot/grub.cfg"
+
+# Kernel and initrd locations for ISOs that do not ship a /boot/grub/loopback.cfg,
+# with the kernel arguments that tell their initramfs where to find the ISO file.
+# $iso_path, $iso_label and $dev_uuid are GRUB variables set by the menu entry.
+MULTIBOOT_KERNEL_LAYOUTS = [
+    ("/casper/vmlinuz", "/casper/initrd",
+     "boot=casper iso-scan/filename=$iso_path quiet splash"),
+    ("/live/vmlinuz", "/live/initrd.img",
+     "boot=live findiso=$iso_path components quiet splash"),
+    ("/images/pxeboot/vmlinuz", "/images/pxeboot/initrd.img",
+     "root=live:CDLABEL=$iso_label iso-scan/filename=$iso_path rd.live.image quiet"),
+    ("/arch/boot/x86_64/vmlinuz-linux", "/arch/boot/x86_64/initramfs-linux.img",
+     "img_dev=/dev/disk/by-uuid/$dev_uuid img_loop=$iso_path earlymodules=loop"),
+]
+
+# Stub written to the boot partition once; it hands over to the menu on the
+# data partition so adding or removing an ISO never touches the boot partition.
+MULTIBOOT_GRUB_STUB = f"""\
+insmod part_gpt
+insmod part_msdos
+insmod fat
+insmod exfat
+insmod ntfs
+search --no-floppy --set=root --file /{MULTIBOOT_GRUB_CFG}
+configfile /{MULTIBOOT_GRUB_CFG}
+"""
+
+
+def multiboot_iso_filename(iso_path: str) -> str:
+    """Return the file name an ISO is stored under on a multiboot stick"""
+    name = os.path.basename(iso_path)
+    # Kernel command lines and GRUB paths do not tolerate spaces or quotes
+    return ''.join(c if c.isalnum() or c in '._-' else '_' for c in name)
+
+
+def build_multiboot_grub_cfg(entries: List[Dict]) -> str:
+    """Build the GRUB menu for the ISOs listed in a multiboot manifest"""
+    lines = [
+        "# Generated by Bootable USB Creator - changes are overwritten",
+        "set timeout=10",
+        "set default=0",
+        "insmod iso9660",
+        "insmod udf",
+        "insmod loopback",
+        f"search --no-floppy --set=root --file /{MULTIBOOT_MANIFEST}",
+        "probe --set=dev_uuid -u $root",
+        "export dev_uuid",
+        "",
+    ]
+
+    for entry in entries:
+        iso_path = f"/{MULTIBOOT_ISO_DIR}/{entry['file']}"
+        title = entry.get('title', entry['file']).replace('"', "'")
+        lines.append(f'menuentry "{title}" {{')
+        lines.append(f'    set iso_path="{iso_path}"')
+        lines.append('    export iso_path')
+        lines.append('    loopback loop $iso_path')
+        if entry.get('kind') == 'loopback':
+            lines.append('    set root=(loop)')
+            lines.append('    configfile /boot/grub/loopback.cfg')
+        else:
+            lines.append('    probe --set=iso_label -l (loop)')
+            lines.append(f"    linux (loop){entry['kernel']} {entry['args']}")
+            lines.append(f"    initrd (loop){entry['initrd']}")
+        lines.append('}')
+        lines.append('')
+
+    lines.append('menuentry "Reboot" {')
+    lines.append('    reboot')
+    lines.append('}')
+    lines.append('menuentry "Power off" {')
+    lines.append('    halt')
+    lines.append('}')
+    return "\n".join(lines) + "\n"
+
+
+
+# Background ISO verification: digests are cached by file identity so an ISO
+# that has not changed is never read twice just to be hashed.
+HASH_CACHE_FILE = os.path.join(os.path.expanduser('~'), '.cache', 'bootable_usb_creator', 'iso_hashes.json')
+HASH_CHUNK_SIZE = 8 * 1024 * 1024
+CHECKSUM_FILE_NAMES = ['SHA256SUMS', 'SHA256SUMS.txt', 'sha256sums.txt', 'sha256sum.txt', 'CHECKSUM']
+
+
+def sha256_file(path: str, cancel: Optional[threading.Event] = None,
+                progress=None) -> Optional[str]:
+    """Hash a file with large sequential reads; returns None if cancelled"""
+    digest = hashlib.sha256()
+    buffer = bytearray(HASH_CHUNK_SIZE)
+    view = memoryview(buffer)
+    
+    with open(path, 'rb', buffering=0) as f:
+        total = os.fstat(f.fileno()).st_size
+        # Ask for aggressive readahead. Pages are deliberately left in the page
+        # cache so the copy stage can reuse them if the ISO is flashed next.
+        if hasattr(os, 'posix_fadvise'):
+            os.posix_fadvise(f.fileno(), 0, 0, os.POSIX_FADV_SEQUENTIAL)
+        
+        done = 0
+        while True:
+            if cancel is not None and cancel.is_set():
+                return None
+            count = f.readinto(buffer)
+            if not count:
+                break
+            digest.update(view[:count])
+            done += count
+            if progress is not None:
+                progress(done, total)
+    
+    return digest.hexdigest()
+
+
+def parse_checksum_file(path: str, iso_name: str) -> Optional[str]:
+    """Find the SHA256 digest listed for iso_name in a checksum file"""
+    try:
+        with open(path, errors='replace') as f:
+            lines = f.read().splitlines()
+    except OSError:
+        return None
+    
+    for line in lines:
+        line = line.strip()
+        # BSD style: SHA256 (name.iso) = <digest>
+        match = re.match(r'^SHA256 \((.+)\) = ([0-9a-fA-F]{64})$', line)
+        if match and os.path.basename(match.group(1)) == iso_name:
+            return match.group(2).lower()
+        # GNU style: <digest>  name.iso  or  <digest> *name.iso
+        match = re.match(r'^([0-9a-fA-F]{64})\s+\*?(.+)$', line)
+        if match and os.path.basename(match.group(2).strip()) == iso_name:
+            return match.group(1).lower()
+    
+    # A bare digest in a per-file checksum such as name.iso.sha256 or name.sha256
+    checksum_name = os.path.basename(path)
+    if len(lines) == 1 and re.match(r'^[0-9a-fA-F]{64}$', lines[0].strip()) and \
+            (checksum_name.startswith(iso_name) or Path(checksum_name).stem == Path(iso_name).stem):
+        return lines[0].strip().lower()
+    return None
+
+
+def find_expected_sha256(iso_path: str) -> Optional[tuple]:
+    """Look next to an ISO for a vendor checksum file listing it
+
+    Returns (digest, checksum_file) or None.
+    """
+    directory = os.path.dirname(os.path.abspath(iso_path))
+    iso_name = os.path.basename(iso_path)
+    candidates = [f"{iso_path}.sha256", f"{iso_path}.sha256sum",
+                  os.path.join(directory, f"{Path(iso_path).stem}.sha256")]
+    candidates += [os.path.join(directory, name) for name in CHECKSUM_FILE_NAMES]
+    try:
+        candidates += sorted(os.path.join(directory, name) for name in os.listdir(directory)
+                             if name.lower().endswith(('.sha256', '.sha256sum')) or 'SHA256SUMS' in name)
+    except OSError:
+        pass
+    
+    seen = set()
+    for candidate in candidates:
+        if candidate in seen or not os.path.isfile(candidate):
+            continue
+        seen.add(candidate)
+        digest = parse_checksum_file(candidate, iso_name)
+        if digest:
+            return digest, candidate
+    return None
+
+
+class ISOHashCache:
+    """SHA256 digests of ISO files keyed by inode, size and modification time"""
+    def __init__(self, path: str = HASH_CACHE_FILE):
+        self.path = path
+        self.lock = threading.Lock()
+    
+    @staticmethod
+    def _key(st: os.stat_result) -> str:
+        return f"{st.st_dev}:{st.st_ino}:{st.st_size}:{st.st_mtime_ns}"
+    
+    def _load(self) -> Dict:
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+    
+    def get(self, iso_path: str) -> Optional[str]:
+        """Return the cached digest if the file is unchanged since it was hashed"""
+        with self.lock:
+            return self._load().get(self._key(os.stat(iso_path)))
+    
+    def put(self, iso_path: str, digest: str):
+        """Remember the digest of a file"""
+        key = self._key(os.stat(iso_path))
+        with self.lock:
+            entries = self._load()
+            entries[key] = digest
+            try:
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+                tmp_path = f"{self.path}.tmp"
+                with open(tmp_path, 'w') as f:
+                    json.dump(entries, f)
+                os.replace(tmp_path, self.path)
+            except OSError:
+                pass
+
+
+# Fake-capacity probe. Counterfeit sticks wrap addresses beyond their real size,
+# so a write at offset h lands at h % real_size and reading it back through the
+# same wrap still returns the right block. The wrap is caught instead by tagging
+# every sector of a low region with its own offset and then reading one block
+# per region length across the rest of the device: whatever the real size, one
+# of those reads lands back in the region, and the tag it returns gives the real
+# size exactly. Tagged blocks at stratified offsets across the whole device then
+# catch sticks that drop writes or fail with I/O errors instead of wrapping.
+CAPACITY_SAMPLE_COUNT = 256
+CAPACITY_SAMPLE_SIZE = 64 * 1024
+CAPACITY_PROBE_WORKERS = 8
+CAPACITY_ALIGNMENT = 4096
+CAPACITY_SECTOR = 512
+CAPACITY_MIN_REGION = 16 * 1024 * 1024
+CAPACITY_MAX_WRAP_READS = 4096
+CAPACITY_REGION_CHUNK = 1024 * 1024
+CAPACITY_MAGIC = b'BUCPROBE'
+
+
+class CapacityCheckResult:
+    """Outcome of a sampled write/read-back test of a device or image file"""
+    def __init__(self, path: str, reported_size: int, samples: int):
+        self.path = path
+        self.reported_size = reported_size
+        self.samples = samples
+        self.bad_offsets: List[int] = []
+        # Size at which writes wrap back onto the start of the device, if they do
+        self.wrap_size: Optional[int] = None
+        self.elapsed = 0.0
+    
+    @property
+    def ok(self) -> bool:
+        return not self.bad_offsets and self.wrap_size is None
+    
+    @property
+    def usable_size(self) -> int:
+        """Real capacity: the wrap size, else everything below the first failing sample"""
+        if self.wrap_size is not None:
+            return self.wrap_size
+        return min(self.bad_offsets) if self.bad_offsets else self.reported_size
+    
+    def to_dict(self) -> Dict:
+        return {
+            'path': self.path,
+            'ok': self.ok,
+            'reported_size': self.reported_size,
+            'usable_size': self.usable_size,
+            'wrap_size': self.wrap_size,
+            'samples': self.samples,
+            'bad_samples': len(self.bad_offsets),
+            'first_bad_offset': min(self.bad_offsets) if self.bad_offsets else None,
+            'elapsed': round(self.elapsed, 2),
+        }
+
+
+def capacity_sample_offsets(size: int, count: int, sample_size: int, seed: bytes) -> List[int]:
+    """Pick one aligned offset per equal stratum of the device, plus the last block"""
+    import random
+    
+    last = (size - sample_size) // CAPACITY_ALIGNMENT * CAPACITY_ALIGNMENT
+    if last < 0:
+        return []
+    rng = random.Random(seed)
+    stride = last / count
+    candidates = {0, last}
+    for i in range(count):
+        # Jitter within each stratum so a controller cannot special-case fixed offsets
+        offset = int(i * stride + rng.random() * max(stride - sample_size, 0))
+        candidates.add(offset // CAPACITY_ALIGNMENT * CAPACITY_ALIGNMENT)
+    
+    # Samples are written concurrently, so they must never overlap
+    offsets: List[int] = []
+    for offset in sorted(candidates):
+        if not offsets or offset >= offsets[-1] + sample_size:
+            if offset + sample_size > last and offset != last:
+                continue
+            offsets.append(offset)
+    return offsets
+
+
+def capacity_probe_pattern(nonce: bytes, offset: int, size: int) -> bytes:
+    """Build a block that is unique to this run and this position"""
+    tag = CAPACITY_MAGIC + nonce + offset.to_bytes(8, 'little')
+    fill = hashlib.sha256(tag).digest() * (size // 32 + 1)
+    return (tag + fill)[:size - len(tag)] + tag
+
+
+def capacity_region_sectors(nonce: bytes, start: int, length: int) -> bytes:
+    """Build sectors that each carry this run's tag and their own offset"""
+    return b''.join((CAPACITY_MAGIC + nonce + offset.to_bytes(8, 'little')) * (CAPACITY_SECTOR // 32)
+                    for offset in range(start, start + length, CAPACITY_SECTOR))
+
+
+def check_capacity(path: str, sample_count: int = CAPACITY_SAMPLE_COUNT,
+                   sample_size: int = CAPACITY_SAMPLE_SIZE,
+                   workers: int = CAPACITY_PROBE_WORKERS) -> CapacityCheckResult:
+    """Detect wrapped, dropped or failing writes on a device or image file
+
+    DESTRUCTIVE: the tagged region at the start and the probed blocks are
+    overwritten. Raises ValueError for a target too small to sample.
+    """
+    import mmap
+    import random
+    import time
+    from concurrent.futures import ThreadPoolExecutor
+    
+    start = time.time()
+    direct = hasattr(os, 'O_DIRECT')
+    try:
+        fd = os.open(path, os.O_RDWR | (os.O_DIRECT if direct else 0))
+    except OSError:
+        # Some file systems (tmpfs, overlays) refuse O_DIRECT; fall back to the page cache
+        direct = False
+        fd = os.open(path, os.O_RDWR)
+    
+    try:
+        size = os.lseek(fd, 0, os.SEEK_END)
+        nonce = os.urandom(16)
+        local = threading.local()
+        
+        def buffer():
+            # Anonymous mmaps are page aligned, as O_DIRECT requires
+            if not hasattr(local, 'buf'):
+                local.buf = mmap.mmap(-1, sample_size)
+            return local.buf
+        
+        def flush():
+            os.fsync(fd)
+            if not direct and hasattr(os, 'posix_fadvise'):
+                # Make the read-back hit the medium rather than our own cached pages
+                os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+        
+        def write_block(offset) -> bool:
+            buf = buffer()
+            buf[:] = capacity_probe_pattern(nonce, offset, sample_size)
+            try:
+                return os.pwrite(fd, buf, offset) == sample_size
+            except OSError:
+                return False
+        
+        def verify_block(offset) -> bool:
+            buf = buffer()
+            try:
+                return os.preadv(fd, [buf], offset) == sample_size and \
+                    buf[:] == capacity_probe_pattern(nonce, offset, sample_size)
+            except OSError:
+                return False
+        
+        def sector_tag(data) -> Optional[int]:
+            """Offset tagged in a region sector written by this run, if data starts with one"""
+            if data[:len(CAPACITY_MAGIC) + 16] != CAPACITY_MAGIC + nonce:
+                return None
+            return int.from_bytes(data[len(CAPACITY_MAGIC) + 16:len(CAPACITY_MAGIC) + 24], 'little')
+        
+        # Tagged region: large enough that one read per region length across the
+        # device stays within CAPACITY_MAX_WRAP_READS
+        region = round_up(max(CAPACITY_MIN_REGION, size // CAPACITY_MAX_WRAP_READS), CAPACITY_REGION_CHUNK)
+        region = min(region, size // 2 // CAPACITY_ALIGNMENT * CAPACITY_ALIGNMENT)
+        chunk = mmap.mmap(-1, CAPACITY_REGION_CHUNK)
+        view = memoryview(chunk)
+        wrap_size = None
+        bad = []
+        wrap_reads = 0
+        if region >= CAPACITY_ALIGNMENT:
+            for first in range(0, region, CAPACITY_REGION_CHUNK):
+                length = min(CAPACITY_REGION_CHUNK, region - first)
+                chunk[:length] = capacity_region_sectors(nonce, first, length)
+                try:
+                    if os.pwrite(fd, view[:length], first) != length:
+                        bad.append(first)
+                except OSError:
+                    bad.append(first)
+            flush()
+            
+            # A real size below the region shows up in the region itself: a sector
+            # at pos then holds the last one written at pos +- k * real size
+            aliases = []
+            for first in range(0, region, CAPACITY_REGION_CHUNK):
+                length = min(CAPACITY_REGION_CHUNK, region - first)
+                try:
+                    if os.preadv(fd, [view[:length]], first) != length:
+                        bad.append(first)
+                        continue
+                except OSError:
+                    bad.append(first)
+                    continue
+                if chunk[:length] == capacity_region_sectors(nonce, first, length):
+                    continue
+                for pos in range(first, first + length, CAPACITY_SECTOR):
+                    tag = sector_tag(chunk[pos - first:pos - first + CAPACITY_SECTOR])
+                    if tag is None:
+                        bad.append(pos)
+                        break
+                    if tag != pos:
+                        aliases.append(abs(tag - pos))
+            if aliases:
+                wrap_size = min(aliases)
+            
+            # Reads at c + k * region, ascending: the first one to return a region
+            # sector is the first to pass the real size, by less than one region
+            probe_offset = random.Random(nonce).randrange(0, region, CAPACITY_ALIGNMENT)
+            probe = region + probe_offset
+            while wrap_size is None and probe + CAPACITY_ALIGNMENT <= size:
+                wrap_reads += 1
+                try:
+                    if os.preadv(fd, [view[:CAPACITY_ALIGNMENT]], probe) != CAPACITY_ALIGNMENT:
+                        bad.append(probe)
+                        break
+                except OSError:
+                    bad.append(probe)
+                    break
+                tag = sector_tag(chunk[:CAPACITY_SECTOR])
+                if tag is not None:
+                    wrap_size = probe - tag
+                probe += region
+        view.release()
+        chunk.close()
+        
+        offsets = capacity_sample_offsets(size, sample_count, sample_size, nonce)
+        if not offsets and region < CAPACITY_ALIGNMENT:
+            raise ValueError(f"{size} bytes is too small to test")
+        result = CapacityCheckResult(path, size, len(offsets) + wrap_reads + (region >= CAPACITY_ALIGNMENT))
+        result.wrap_size = wrap_size
+        
+        if wrap_size is None:
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                written = dict(zip(offsets, pool.map(write_block, offsets)))
+                flush()
+                verified = dict(zip(offsets, pool.map(verify_block, offsets)))
+            bad += [offset for offset in offsets if not (written[offset] and verified[offset])]
+        result.bad_offsets = sorted(bad)
+        
+        result.elapsed = time.time() - start
+        return result
+    
+    finally:
+        os.close(fd)
+
+
+# Native FAT32/exFAT formatter: only the boot region, FATs and root directory
+# are written, streamed in erase-block sized chunks, with the FATs and the
+# data region aligned to the flash erase block so cluster writes never
+# straddle two blocks.
+FORMAT_DEFAULT_ERASE_BLOCK = 4 * 1024 * 1024
+FORMAT_WRITE_CHUNK = 4 * 1024 * 1024
+FAT32_MIN_CLUSTERS = 65525
+FAT32_MAX_CLUSTERS = 0x0FFFFFF5
+EXFAT_MAX_CLUSTERS = 0xFFFFFFF5
+# Minimal boot code for the volume boot record: cli; hlt; jmp $-1
+VBR_HALT_CODE = b'\xfa\xf4\xeb\xfd'
+
+
+def block_device_geometry(path: str) -> tuple:
+    """Return (size, sector size, partition offset, erase block) in bytes for a device or image file"""
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        size = os.lseek(fd, 0, os.SEEK_END)
+    finally:
+        os.close(fd)
+    
+    sector_size, offset, erase_block = 512, 0, FORMAT_DEFAULT_ERASE_BLOCK
+    if not os.path.isfile(path):
+        sys_path = os.path.realpath(f"/sys/class/block/{os.path.basename(os.path.realpath(path))}")
+        
+        def read_int(*parts):
+            try:
+                with open(os.path.join(*parts)) as f:
+                    return int(f.read().strip())
+            except (OSError, ValueError):
+                return 0
+        
+        disk_path = sys_path
+        if os.path.exists(os.path.join(sys_path, 'partition')):
+            offset = read_int(sys_path, 'start') * 512
+            disk_path = os.path.dirname(sys_path)
+        sector_size = read_int(disk_path, 'queue', 'logical_block_size') or 512
+        for attr in ('optimal_io_size', 'discard_granularity'):
+            value = read_int(disk_path, 'queue', attr)
+            # Only trust values that look like a flash erase block
+            if 64 * 1024 <= value <= 64 * 1024 * 1024 and value & (value - 1) == 0:
+                erase_block = value
+                break
+    
+    return size, sector_size, offset, erase_block
+
+
+def write_metadata(path: str, length: int, pieces: List[tuple]):
+    """Write [0, length) of a volume: zeros, overlaid with (offset, bytes) pieces
+
+    The region is streamed in FORMAT_WRITE_CHUNK writes so every byte is written once.
+    """
+    pieces = sorted(pieces)
+    fd = os.open(path, os.O_WRONLY)
+    try:
+        for start in range(0, length, FORMAT_WRITE_CHUNK):
+            end = min(start + FORMAT_WRITE_CHUNK, length)
+            chunk = bytearray(end - start)
+            for offset, data in pieces:
+                if offset < end and offset + len(data) > start:
+                    lo, hi = max(offset, start), min(offset + len(data), end)
+                    chunk[lo - start:hi - start] = data[lo - offset:hi - offset]
+            os.pwrite(fd, chunk, start)
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def round_up(value: int, multiple: int) -> int:
+    return -(-value // multiple) * multiple
+
+
+def format_alignment(size: int, sector_size: int, erase_block: int) -> int:
+    """Alignment in sectors, relaxed on small volumes so padding stays under ~1%"""
+    align = erase_block
+    while align > sector_size and align * 100 > size:
+        align //= 2
+    return max(align // sector_size, 1)
+
+
+def format_fat32(path: str, label: str = "", erase_block: Optional[int] = None) -> Dict:
+    """Create a FAT32 file system on a partition or image file"""
+    import struct
+    
+    size, bps, part_offset, detected_erase_block = block_device_geometry(path)
+    align = format_alignment(size, bps, erase_block or detected_erase_block)
+    total = size // bps
+    offset_sectors = part_offset // bps
+    
+    # Largest cluster (up to 32KB) that still leaves a valid FAT32 cluster count;
+    # large clusters mean fewer FAT updates and longer sequential runs when copying
+    for cluster_bytes in (32768, 16384, 8192, 4096, 2048, 1024, 512):
+        spc = cluster_bytes // bps
+        if spc < 1:
+            continue
+        # Reserved region ends on an erase block boundary so FAT 1 starts aligned
+        reserved = 32
+        reserved += (-(offset_sectors + reserved)) % align
+        fat_size = 1
+        while True:
+            clusters = (total - reserved - 2 * fat_size) // spc
+            needed = round_up(round_up((clusters + 2) * 4, bps) // bps, align)
+            if needed <= fat_size:
+                break
+            fat_size = needed
+        if FAT32_MIN_CLUSTERS <= clusters:
+            break
+    else:
+        raise ValueError(f"{size} bytes is too small for FAT32")
+    if clusters > FAT32_MAX_CLUSTERS or total > 0xFFFFFFFF:
+        raise ValueError(f"{size} bytes is too large for FAT32")
+    
+    data_start = reserved + 2 * fat_size
+    label_bytes = fat_volume_label(label)
+    volume_id = struct.unpack('<I', os.urandom(4))[0]
+    
+    boot = bytearray(bps)
+    boot[0:3] = b'\xeb\x58\x90'
+    boot[3:11] = b'MSWIN4.1'
+    struct.pack_into('<HBHBHHBHHHII', boot, 11, bps, spc, reserved, 2, 0, 0, 0xF8, 0, 63, 255,
+                     offset_sectors, total)
+    struct.pack_into('<IHHIHH', boot, 36, fat_size, 0, 0, 2, 1, 6)
+    struct.pack_into('<BBBI', boot, 64, 0x80, 0, 0x29, volume_id)
+    boot[71:82] = label_bytes or b'NO NAME    '
+    boot[82:90] = b'FAT32   '
+    boot[90:90 + len(VBR_HALT_CODE)] = VBR_HALT_CODE
+    boot[510:512] = b'\x55\xaa'
+    
+    fsinfo = bytearray(bps)
+    struct.pack_into('<I', fsinfo, 0, 0x41615252)
+    struct.pack_into('<III', fsinfo, 484, 0x61417272, clusters - 1, 3)
+    struct.pack_into('<I', fsinfo, 508, 0xAA550000)
+    
+    # Media descriptor, clean-shutdown marker, end of chain for the root directory
+    fat_head = struct.pack('<III', 0x0FFFFFF8, 0x0FFFFFFF, 0x0FFFFFFF)
+    
+    pieces = [(0, bytes(boot)), (bps, bytes(fsinfo)), (6 * bps, bytes(boot)), (7 * bps, bytes(fsinfo)),
+              (reserved * bps, fat_head), ((reserved + fat_size) * bps, fat_head)]
+    if label_bytes:
+        pieces.append((data_start * bps, label_bytes + b'\x08'))
+    write_metadata(path, (data_start + spc) * bps, pieces)
+    
+    return {'fs': 'FAT32', 'cluster_size': spc * bps, 'clusters': clusters,
+            'fat_offset': (part_offset + reserved * bps), 'data_offset': part_offset + data_start * bps,
+            'alignment': align * bps}
+
+
+def fat_volume_label(label: str) -> bytes:
+    """FAT volume label: 11 upper-case bytes, padded with spaces; empty for no label"""
+    clean = ''.join(c if c.isalnum() or c in '_-' else '_' for c in label.upper())
+    clean = clean.encode('ascii', 'replace')[:11]
+    return clean.ljust(11, b' ') if clean else b''
+
+
+def exfat_checksum(data: bytes, skip=()) -> int:
+    """exFAT rotating 32-bit checksum, as used by the boot region and the up-case table"""
+    checksum = 0
+    for i, byte in enumerate(data):
+        if i in skip:
+            continue
+        checksum = (((checksum & 1) << 31) | (checksum >> 1)) + byte
+        checksum &= 0xFFFFFFFF
+    return checksum
+
+
+def exfat_upcase_table() -> bytes:
+    """Compressed exFAT up-case table: runs of unchanged characters become 0xFFFF, run length"""
+    import struct
+    
+    mapping = []
+    for cp in range(0x10000):
+        upper = chr(cp).upper() if not 0xD800 <= cp <= 0xDFFF else chr(cp)
+        mapping.append(ord(upper) if len(upper) == 1 and ord(upper) <= 0xFFFF else cp)
+    
+    out = []
+    cp = 0
+    while cp < 0x10000:
+        run = 0
+        while cp + run < 0x10000 and mapping[cp + run] == cp + run:
+            run += 1
+        if run > 2:
+            out += [0xFFFF, run]
+            cp += run
+        else:
+            out.append(mapping[cp])
+            cp += 1
+    return struct.pack(f'<{len(out)}H', *out)
+
+
+def format_exfat(path: str, label: str = "", erase_block: Optional[int] = None) -> Dict:
+    """Create an exFAT file system on a partition or image file"""
+    import struct
+    
+    size, bps, part_offset, detected_erase_block = block_device_geometry(path)
+    align = format_alignment(size, bps, erase_block or detected_erase_block)
+    total = size // bps
+    
+    # Microsoft's defaults, which already favour large sequential transfers
+    if size <= 256 * 1024**2:
+        cluster_bytes = 4096
+    elif size <= 32 * 1024**3:
+        cluster_bytes = 32768
+    else:
+        cluster_bytes = 131072
+    cluster_bytes = max(cluster_bytes, bps)
+    spc = cluster_bytes // bps
+    
+    # FAT and cluster heap both start on erase block boundaries
+    offset_sectors = part_offset // bps
+    fat_offset = round_up(offset_sectors + 24, align) - offset_sectors
+    clusters = min((total - fat_offset) // spc, EXFAT_MAX_CLUSTERS)
+    fat_length = round_up(round_up((clusters + 2) * 4, bps) // bps, align)
+    heap_offset = fat_offset + fat_length
+    clusters = min((total - heap_offset) // spc, EXFAT_MAX_CLUSTERS)
+    if clusters < 16:
+        raise ValueError(f"{size} bytes is too small for exFAT")
+    
+    upcase = exfat_upcase_table()
+    bitmap_clusters = round_up(round_up(clusters, 8) // 8, cluster_bytes) // cluster_bytes
+    upcase_clusters = round_up(len(upcase), cluster_bytes) // cluster_bytes
+    bitmap_cluster = 2
+    upcase_cluster = bitmap_cluster + bitmap_clusters
+    root_cluster = upcase_cluster + upcase_clusters
+    used = bitmap_clusters + upcase_clusters + 1
+    
+    boot = bytearray(bps)
+    boot[0:3] = b'\xeb\x76\x90'
+    boot[3:11] = b'EXFAT   '
+    struct.pack_into('<QQIIIIIIHHBBBBB', boot, 64, offset_sectors, total, fat_offset, fat_length,
+                     heap_offset, clusters, root_cluster, struct.unpack('<I', os.urandom(4))[0],
+                     0x0100, 0, bps.bit_length() - 1, spc.bit_length() - 1, 1, 0x80, 0)
+    boot[120:120 + len(VBR_HALT_CODE)] = VBR_HALT_CODE
+    boot[510:512] = b'\x55\xaa'
+    
+    extended = bytearray(bps)
+    struct.pack_into('<I', extended, bps - 4, 0xAA550000)
+    region = bytes(boot) + bytes(extended) * 8 + bytes(bps) * 2
+    # VolumeFlags and PercentInUse are excluded so they can change without a rewrite
+    checksum = exfat_checksum(region, skip=(106, 107, 112))
+    region += struct.pack('<I', checksum) * (bps // 4)
+    
+    fat = [0xFFFFFFF8, 0xFFFFFFFF]
+    for first, count in ((bitmap_cluster, bitmap_clusters), (upcase_cluster, upcase_clusters),
+                         (root_cluster, 1)):
+        fat += list(range(first + 1, first + count)) + [0xFFFFFFFF]
+    fat_head = struct.pack(f'<{len(fat)}I', *fat)
+    
+    bitmap = bytearray(round_up(used, 8) // 8)
+    for index in range(used):
+        bitmap[index // 8] |= 1 << (index % 8)
+    
+    root = bytearray()
+    name = label[:11].encode('utf-16-le')
+    if name:
+        root += struct.pack('<BB22s8x', 0x83, len(name) // 2, name)
+    root += struct.pack('<BB18xIQ', 0x81, 0, bitmap_cluster, round_up(clusters, 8) // 8)
+    root += struct.pack('<B3xI12xIQ', 0x82, exfat_checksum(upcase), upcase_cluster, len(upcase))
+    
+    def cluster_offset(cluster):
+        return (heap_offset + (cluster - 2) * spc) * bps
+    
+    pieces = [(0, region), (12 * bps, region), (fat_offset * bps, fat_head),
+              (cluster_offset(bitmap_cluster), bytes(bitmap)),
+              (cluster_offset(upcase_cluster), upcase),
+              (cluster_offset(root_cluster), bytes(root))]
+    write_metadata(path, cluster_offset(root_cluster) + cluster_bytes, pieces)
+    
+    return {'fs': 'exFAT', 'cluster_size': cluster_bytes, 'clusters': clusters,
+            'fat_offset': part_offset + fat_offset * bps, 'data_offset': part_offset + heap_offset * bps,
+            'alignment': align * bps}
+
+
+# Job history: every run is recorded so the ETA can be predicted up front from
+# earlier runs on the same stick model, and sticks that have slowed down can be
+# spotted before they fail outright.
+HISTORY_DB = os.path.join(os.path.expanduser('~'), '.local', 'share', 'bootable_usb_creator', 'history.db')
+HISTORY_PREDICTION_RUNS = 10
+HISTORY_DEGRADED_RATIO = 0.7
+HISTORY_MIN_RUNS = 3
+
+HISTORY_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    started REAL NOT NULL,
+    finished REAL,
+    device_serial TEXT,
+    device_model TEXT,
+    device_size TEXT,
+    iso TEXT,
+    iso_size INTEGER,
+    engine TEXT NOT NULL,
+    file_system TEXT,
+    status TEXT NOT NULL DEFAULT 'running',
+    error TEXT
+);
+CREATE TABLE IF NOT EXISTS stages (
+    job_id INTEGER NOT NULL REFERENCES jobs(id),
+    name TEXT NOT NULL,
+    duration REAL NOT NULL,
+    bytes INTEGER
+);
+CREATE INDEX IF NOT EXISTS jobs_model ON jobs (device_model, engine);
+CREATE INDEX IF NOT EXISTS jobs_serial ON jobs (device_serial, engine);
+"""
+
+
+def format_duration(seconds: float) -> str:
+    minutes, seconds = divmod(int(seconds), 60)
+    return f"{minutes}m {seconds:02d}s" if minutes else f"{seconds}s"
+
+
+def median(values: List[float]) -> float:
+    ordered = sorted(values)
+    middle = len(ordered) // 2
+    return ordered[middle] if len(ordered) % 2 else (ordered[middle - 1] + ordered[middle]) / 2
+
+
+class JobHistory:
+    """SQLite record of every job with per-stage durations and throughput
+
+    Stages that move the ISO's data record their byte count; their throughput
+    drives ETA prediction and the stick health checks.
+    """
+    def __init__(self, path: str = HISTORY_DB):
+        self.path = path
+    
+    def _connect(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=10)
+        conn.executescript(HISTORY_SCHEMA)
+        return conn
+    
+    def start_job(self, device: Optional[USBDevice], iso: str, engine: str, file_system: str = "") -> int:
+        """Record the start of a job and return its id"""
+        import time
+        from contextlib import closing
+        
+        iso_size = os.path.getsize(iso) if os.path.isfile(iso) else None
+        with closing(self._connect()) as conn, conn:
+            cursor = conn.execute(
+                "INSERT INTO jobs (started, device_serial, device_model, device_size, iso, iso_size, "
+                "engine, file_system) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (time.time(), device.serial if device else None, device.model if device else None,
+                 device.size if device else None, os.path.basename(iso), iso_size, engine, file_system)
+            )
+            return cursor.lastrowid
+    
+    def record_stage(self, job_id: int, name: str, duration: float, data_bytes: Optional[int] = None):
+        """Record how long one stage of a job took"""
+        from contextlib import closing
+        
+        with closing(self._connect()) as conn, conn:
+            conn.execute("INSERT INTO stages (job_id, name, duration, bytes) VALUES (?, ?, ?, ?)",
+                         (job_id, name, duration, data_bytes))
+    
+    def finish_job(self, job_id: int, status: str, error: str = ""):
+        """Record how a job ended: success, failed or skipped"""
+        import time
+        from contextlib import closing
+        
+        with closing(self._connect()) as conn, conn:
+            conn.execute("UPDATE jobs SET finished = ?, status = ?, error = ? WHERE id = ?",
+                         (time.time(), status, error or None, job_id))
+    
+    def _job_profiles(self, where: str, params: tuple, limit: int) -> List[tuple]:
+        """(fixed seconds, data bytes, data seconds) of recent successful jobs"""
+        from contextlib import closing
+        
+        with closing(self._connect()) as conn:
+            return conn.execute(
+                "SELECT SUM(CASE WHEN s.bytes IS NULL THEN s.duration ELSE 0 END), "
+                "SUM(COALESCE(s.bytes, 0)), SUM(CASE WHEN s.bytes IS NULL THEN 0 ELSE s.duration END) "
+                f"FROM jobs j JOIN stages s ON s.job_id = j.id WHERE j.status = 'success' AND {where} "
+                "GROUP BY j.id ORDER BY j.started DESC LIMIT ?",
+                params + (limit,)
+            ).fetchall()
+    
+    def predict_duration(self, model: str, engine: str, data_bytes: int) -> Optional[tuple]:
+        """Predict (seconds, runs used) for a job from past runs of the same model and engine"""
+        profiles = [p for p in self._job_profiles("j.device_model = ? AND j.engine = ?", (model, engine),
+                                                  HISTORY_PREDICTION_RUNS) if p[1] and p[2]]
+        if not profiles:
+            return None
+        fixed = median([p[0] for p in profiles])
+        rate = median([p[1] / p[2] for p in profiles])
+        return fixed + data_bytes / rate, len(profiles)
+    
+    def throughput_trend(self, serial: str, engine: str) -> Optional[tuple]:
+        """Return (latest, baseline) bytes/s for a stick if it has slowed down noticeably"""
+        from contextlib import closing
+        
+        if not serial:
+            return None
+        # Throughput depends on the ISO as much as the stick (a file copy of many
+        # small files is far slower than one large one), so only earlier runs of
+        # the same ISO make a fair baseline
+        with closing(self._connect()) as conn:
+            latest_iso = conn.execute(
+                "SELECT iso, iso_size FROM jobs WHERE device_serial = ? AND engine = ? AND status = 'success' "
+                "ORDER BY started DESC LIMIT 1", (serial, engine)
+            ).fetchone()
+        if not latest_iso:
+            return None
+        profiles = [p for p in self._job_profiles("j.device_serial = ? AND j.engine = ? AND j.iso IS ? "
+                                                  "AND j.iso_size IS ?", (serial, engine) + latest_iso,
+                                                  HISTORY_PREDICTION_RUNS) if p[1] and p[2]]
+        if len(profiles) < HISTORY_MIN_RUNS:
+            return None
+        # Newest first: compare the latest run against the stick's earlier runs
+        rates = [p[1] / p[2] for p in profiles]
+        latest, baseline = rates[0], median(rates[1:])
+        if latest < baseline * HISTORY_DEGRADED_RATIO:
+            return latest, baseline
+        return None
+    
+    def report(self) -> List[tuple]:
+        """Jobs and write throughput (bytes/s) summarised by device model and engine"""
+        from contextlib import closing
+        
+        with closing(self._connect()) as conn:
+            return conn.execute(
+                "SELECT COALESCE(j.device_model, '?'), j.engine, COUNT(*), "
+                "SUM(j.status = 'success'), AVG(t.rate), MIN(t.rate), MAX(t.rate) "
+                "FROM jobs j LEFT JOIN ("
+                "  SELECT job_id, SUM(bytes) / SUM(duration) AS rate FROM stages "
+                "  WHERE bytes IS NOT NULL AND duration > 0 GROUP BY job_id"
+                ") t ON t.job_id = j.id "
+                "GROUP BY 1, 2 ORDER BY 1, 2"
+            ).fetchall()
+    
+    def degraded_sticks(self) -> List[tuple]:
+        """(serial, model, engine, latest, baseline) for every stick that has slowed down"""
+        from contextlib import closing
+        
+        with closing(self._connect()) as conn:
+            sticks = conn.execute(
+                "SELECT DISTINCT device_serial, device_model, engine FROM jobs "
+                "WHERE device_serial IS NOT NULL AND device_serial != ''"
+            ).fetchall()
+        degraded = []
+        for serial, model, engine in sticks:
+            trend = self.throughput_trend(serial, engine)
+            if trend:
+                degraded.append((serial, model, engine) + trend)
+        return degraded
+
+
+# Duplicator station: sticks are flashed with a master image as soon as they are
+# plugged in. Sticks on one USB host controller share its bandwidth, so writers
+# are limited per controller and the limit is raised only while it raises
+# throughput.
+IMAGE_WRITE_CHUNK = 4 * 1024 * 1024
+DUPLICATOR_MAX_WRITERS_PER_CONTROLLER = 8
+DUPLICATOR_SAMPLE_WINDOW = 10.0
+DUPLICATOR_SCALE_GAIN = 1.10
+DUPLICATOR_REPROBE_INTERVAL = 60.0
+
+
+def write_image(image: str, device: str, progress=None) -> int:
+    """Write an image file to a device with direct I/O; returns bytes written"""
+    import mmap
+    
+    total = os.path.getsize(image)
+    buf = mmap.mmap(-1, IMAGE_WRITE_CHUNK)
+    direct = hasattr(os, 'O_DIRECT')
+    try:
+        out = os.open(device, os.O_WRONLY | (os.O_DIRECT if direct else 0))
+    except OSError:
+        direct = False
+        out = os.open(device, os.O_WRONLY)
+    
+    try:
+        with open(image, 'rb', buffering=0) as src, memoryview(buf) as view:
+            if hasattr(os, 'posix_fadvise'):
+                os.posix_fadvise(src.fileno(), 0, 0, os.POSIX_FADV_SEQUENTIAL)
+            
+            done = 0
+            while done < total:
+                # Fill the whole chunk so every write offset stays aligned
+                count = 0
+                while count < IMAGE_WRITE_CHUNK:
+                    n = src.readinto(view[count:])
+                    if not n:
+                        break
+                    count += n
+                if not count:
+                    break
+                
+                length = count
+                if direct and count % CAPACITY_ALIGNMENT:
+                    # Pad the tail of the image up to the device's block size
+                    length = -(-count // CAPACITY_ALIGNMENT) * CAPACITY_ALIGNMENT
+                    view[count:length] = bytes(length - count)
+                
+                written = 0
+                while written < length:
+                    written += os.pwrite(out, view[written:length], done + written)
+                done += count
+                if progress is not None:
+                    progress(done, total)
+        
+        os.fsync(out)
+        return done
+    
+    finally:
+        os.close(out)
+        buf.close()
+
+
+class DuplicatorJob:
+    """One stick being flashed by the duplicator station"""
+    def __init__(self, device: USBDevice):
+        self.device = device
+        self.state = "queued"
+        self.bytes_done = 0
+        self.started = 0.0
+        self.finished = 0.0
+        self.error = ""
+    
+    @property
+    def controller(self) -> str:
+        # Sticks whose topology is unknown are treated as having a controller of their own
+        return self.device.controller or self.device.bus or self.device.device
+
+
+class ControllerThrottle:
+    """Concurrent writer limit for one USB host controller, tuned from its measured throughput
+
+    Starts with one writer and adds another while each step raises the controller's
+    aggregate throughput by DUPLICATOR_SCALE_GAIN; once a step stops paying off
+    it falls back to the best level seen. Every DUPLICATOR_REPROBE_INTERVAL the
+    settled level is re-measured and one more or one fewer writer is tried, so
+    a single noisy window cannot pin the limit for the whole session.
+    """
+    def __init__(self, max_writers: int = DUPLICATOR_MAX_WRITERS_PER_CONTROLLER):
+        self.max_writers = max_writers
+        self.limit = 1
+        self.best_rate = 0.0
+        self.best_limit = 1
+        # +1 while adding writers, -1 while removing them, 0 when settled
+        self.direction = 1
+        self.settled_at = 0.0
+        self.probed_down = False
+    
+    @property
+    def settled(self) -> bool:
+        return self.direction == 0
+    
+    def record(self, active: int, rate: float, now: float):
+        """Feed the aggregate bytes/s measured over one window with `active` writers"""
+        if active != self.limit:
+            return
+        
+        if self.settled:
+            if now - self.settled_at < DUPLICATOR_REPROBE_INTERVAL:
+                return
+            # Re-probe from a fresh measurement of the current level
+            self.best_rate, self.best_limit = rate, self.limit
+            # Alternate directions between re-probes where both are possible
+            can_go_down, can_go_up = self.limit > 1, self.limit < self.max_writers
+            if can_go_down and (not self.probed_down or not can_go_up):
+                self.direction, self.limit, self.probed_down = -1, self.limit - 1, True
+            elif can_go_up:
+                self.direction, self.limit, self.probed_down = 1, self.limit + 1, False
+            else:
+                self.settled_at = now
+            return
+        
+        if self.direction > 0:
+            improved = rate > self.best_rate * DUPLICATOR_SCALE_GAIN
+        else:
+            # Dropping a writer pays off unless that writer was worth DUPLICATOR_SCALE_GAIN
+            improved = rate * DUPLICATOR_SCALE_GAIN >= self.best_rate
+        
+        if improved:
+            self.best_rate, self.best_limit = rate, self.limit
+            following = self.limit + self.direction
+            if 1 <= following <= self.max_writers:
+                self.limit = following
+                return
+        
+        self.limit = self.best_limit
+        self.direction = 0
+        self.settled_at = now
+
+
+class DuplicatorStation:
+    """Headless hotplug-driven flashing of a master image onto inserted sticks"""
+    def __init__(self, image: str, verify_capacity: bool = True,
+                 max_writers: int = DUPLICATOR_MAX_WRITERS_PER_CONTROLLER):
+        self.image = image
+        self.image_size = os.path.getsize(image)
+        self.verify_capacity = verify_capacity
+        self.max_writers = max_writers
+        self.jobs: Dict[str, DuplicatorJob] = {}
+        self.throttles: Dict[str, ControllerThrottle] = {}
+        self.known: set = set()
+        self.lock = threading.Lock()
+        self.rescan = threading.Event()
+        self.stop = threading.Event()
+        self.history = JobHistory()
+    
+    def log(self, message: str):
+        import time
+        print(f"{time.strftime('%H:%M:%S')} {message}", flush=True)
+    
+    def watch_hotplug(self):
+        """Wake the scheduler whenever udev reports a block device change"""
+        try:
+            process = subprocess.Popen(
+                ['udevadm', 'monitor', '--udev', '--subsystem-match=block'],
+                stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True
+            )
+        except OSError:
+            self.log("udevadm not available, polling for new devices instead")
+            return
+        
+        for line in process.stdout:
+            if self.stop.is_set():
+                break
+            if ' add ' in line or ' remove ' in line:
+                self.rescan.set()
+        process.terminate()
+    
+    def unmount_partitions(self, device: str):
+        """Undo desktop automounting of a freshly inserted stick"""
+        result = subprocess.run(['lsblk', '-J', '-o', 'NAME,MOUNTPOINT', device],
+                                capture_output=True, text=True, check=False)
+        try:
+            data = json.loads(result.stdout)
+        except ValueError:
+            return
+        for dev in data.get('blockdevices', []):
+            for child in dev.get('children', []):
+                if child.get('mountpoint'):
+                    subprocess.run(['umount', f"/dev/{child['name']}"], capture_output=True, check=False)
+    
+    def update_devices(self):
+        """Queue sticks inserted since the last scan and forget removed ones"""
+        try:
+            devices = scan_usb_devices()
+        except (OSError, subprocess.CalledProcessError, json.JSONDecodeError) as e:
+            self.log(f"Error scanning devices: {e}")
+            return
+        
+        present = {dev.device: dev for dev in devices}
+        with self.lock:
+            for name in list(self.known):
+                if name not in present:
+                    self.known.discard(name)
+                    job = self.jobs.pop(name, None)
+                    if job is not None and job.state in ("queued", "checking", "writing"):
+                        self.log(f"[{name}] removed while {job.state}")
+            
+            for name, dev in present.items():
+                if name in self.known:
+                    continue
+                self.known.add(name)
+                self.jobs[name] = DuplicatorJob(dev)
+                controller = self.jobs[name].controller
+                if controller not in self.throttles:
+                    self.throttles[controller] = ControllerThrottle(self.max_writers)
+                self.log(f"[{name}] inserted: {dev.model} {dev.serial} ({dev.size}) on {controller}")
+                try:
+                    prediction = self.history.predict_duration(dev.model, "image", self.image_size)
+                except sqlite3.Error:
+                    prediction = None
+                if prediction:
+                    self.log(f"[{name}] estimated {format_duration(prediction[0])} once started "
+                             f"(from {prediction[1]} previous run(s))")
+    
+    def run_job(self, job: DuplicatorJob):
+        """Thread function for flashing one stick"""
+        import time
+        
+        device = job.device.device
+        job_id = None
+        try:
+            try:
+                job_id = self.history.start_job(job.device, self.image, "image")
+            except sqlite3.Error as e:
+                self.log(f"[{device}] job history unavailable: {e}")
+            stage_started = time.time()
+            
+            def end_stage(name, data_bytes=None):
+                nonlocal stage_started
+                now = time.time()
+                if job_id is not None:
+                    try:
+                        self.history.record_stage(job_id, name, now - stage_started, data_bytes)
+                    except sqlite3.Error as e:
+                        self.log(f"[{device}] could not record stage in job history: {e}")
+                stage_started = now
+            
+            self.unmount_partitions(device)
+            
+            with open(device, 'rb') as f:
+                device_size = f.seek(0, os.SEEK_END)
+            if device_size < self.image_size:
+                raise Exception(f"device is smaller than the image ({device_size} < {self.image_size} bytes)")
+            
+            if self.verify_capacity:
+                job.state = "checking"
+                result = check_capacity(device)
+                end_stage("capacity-check")
+                if not result.ok:
+                    job.state = "bad"
+                    if job_id is not None:
+                        try:
+                            self.history.finish_job(job_id, "skipped", "failed capacity test")
+                        except sqlite3.Error as e:
+                            self.log(f"[{device}] could not record job history: {e}")
+                    self.log(f"[{device}] SKIPPED: failed capacity test, holds at most "
+                             f"{result.usable_size / 1024**3:.2f} GB of {result.reported_size / 1024**3:.2f} GB")
+                    return
+            
+            job.state = "writing"
+            job.started = time.time()
+            
+            def progress(done, total):
+                job.bytes_done = done
+            
+            stage_started = time.time()
+            write_image(self.image, device, progress)
+            end_stage("write", job.bytes_done)
+            job.finished = time.time()
+            job.state = "done"
+            if job_id is not None:
+                try:
+                    self.history.finish_job(job_id, "success")
+                    trend = self.history.throughput_trend(job.device.serial, "image")
+                    if trend:
+                        self.log(f"[{device}] WARNING: wrote at {trend[0] / 1024**2:.1f} MB/s, down from "
+                                 f"{trend[1] / 1024**2:.1f} MB/s on earlier runs - stick may be wearing out")
+                except sqlite3.Error as e:
+                    self.log(f"[{device}] could not record job history: {e}")
+            elapsed = job.finished - job.started
+            self.log(f"[{device}] DONE: {job.bytes_done / 1024**3:.2f} GB in {elapsed:.0f}s "
+                     f"({job.bytes_done / 1024**2 / max(elapsed, 0.001):.1f} MB/s) - remove the stick")
+        
+        except Exception as e:
+            job.state = "failed"
+            job.error = str(e)
+            self.log(f"[{device}] FAILED: {e}")
+            if job_id is not None:
+                try:
+                    self.history.finish_job(job_id, "failed", str(e))
+                except sqlite3.Error:
+                    pass
+    
+    def schedule(self):
+        """Start queued jobs on every controller that has spare writer slots"""
+        with self.lock:
+            by_controller: Dict[str, List[DuplicatorJob]] = {}
+            for job in self.jobs.values():
+                by_controller.setdefault(job.controller, []).append(job)
+            
+            for controller, jobs in by_controller.items():
+                active = sum(1 for job in jobs if job.state in ("starting", "checking", "writing"))
+                for job in jobs:
+                    if active >= self.throttles[controller].limit:
+                        break
+                    if job.state == "queued":
+                        job.state = "starting"
+                        active += 1
+                        thread = threading.Thread(target=self.run_job, args=(job,))
+                        thread.daemon = True
+                        thread.start()
+    
+    def measure(self, samples: Dict[str, tuple]) -> Dict[str, tuple]:
+        """Feed each controller's aggregate write throughput to its throttle once per window"""
+        import time
+        
+        now = time.time()
+        with self.lock:
+            for controller, throttle in self.throttles.items():
+                writing = [job for job in self.jobs.values()
+                           if job.controller == controller and job.state == "writing"]
+                total = sum(job.bytes_done for job in writing)
+                members = frozenset(job.device.device for job in writing)
+                
+                # A window only counts if the same set of writers ran throughout it
+                start = samples.get(controller)
+                if start is None or start[2] != members:
+                    samples[controller] = (now, total, members)
+                    continue
+                if now - start[0] < DUPLICATOR_SAMPLE_WINDOW:
+                    continue
+                
+                rate = (total - start[1]) / (now - start[0])
+                old_limit = throttle.limit
+                throttle.record(len(writing), rate, now)
+                if throttle.limit != old_limit:
+                    self.log(f"{controller}: {rate / 1024**2:.1f} MB/s with {len(writing)} writer(s), "
+                             f"limit now {throttle.limit}")
+                samples[controller] = (now, total, members)
+        return samples
+    
+    def run(self) -> bool:
+        """Flash every stick inserted from now on until interrupted; False if it cannot start"""
+        self.log(f"Duplicator ready: {os.path.basename(self.image)} ({self.image_size / 1024**3:.2f} GB)")
+        
+        # Sticks already plugged in are left alone; only new insertions are flashed.
+        # Without this first scan every stick present would look newly inserted.
+        try:
+            self.known = {dev.device for dev in scan_usb_devices()}
+        except (OSError, subprocess.CalledProcessError, json.JSONDecodeError) as e:
+            self.log(f"Error scanning devices: {e}")
+            return False
+        if self.known:
+            self.log(f"Ignoring devices already present: {', '.join(sorted(self.known))}")
+        self.log("Insert sticks to start flashing. Press Ctrl+C to stop.")
+        
+        watcher = threading.Thread(target=self.watch_hotplug)
+        watcher.daemon = True
+        watcher.start()
+        
+        samples: Dict[str, tuple] = {}
+        try:
+            while not self.stop.is_set():
+                # udev events wake us early; the timeout doubles as a polling fallback
+                self.rescan.wait(2.0)
+                self.rescan.clear()
+                self.update_devices()
+                samples = self.measure(samples)
+                self.schedule()
+        except KeyboardInterrupt:
+            self.log("Stopping; writes in progress are abandoned")
+        finally:
+            self.stop.set()
+        return True
+
 class BootableUSBCreator:
     """Main application class for creating bootable USB drives"""
     
@@ -44,10 +1373,21 @@ class BootableUSBCreator:
         self.partition_scheme = tk.StringVar(value="GPT")
         self.file_system = tk.StringVar(value="FAT32")
         self.volume_label = tk.StringVar(value="BOOTABLE_USB")
+        self.multiboot = tk.BooleanVar(value=False)
+        self.verify_capacity = tk.BooleanVar(value=True)
         
         self.usb_devices: List[USBDevice] = []
         self.is_creating = False
         
+        self.hash_cache = ISOHashCache()
+        self.history = JobHistory()
+        self.job_id: Optional[int] = None
+        self.stage_started = 0.0
+        self.last_copy_bytes: Optional[int] = None
+        self.hash_cancel: Optional[threading.Event] = None
+        self.hash_thread: Optional[threading.Thread] = None
+        self.iso_checksum_status = ""
+        
         self.setup_ui()
         self.refresh_devices()
     
@@ -82,6 +1422,9 @@ class BootableUSBCreator:
         browse_btn = ttk.Button(iso_frame, text="Browse...", command=self.browse_iso)
         browse_btn.grid(row=0, column=2)
         
+        self.checksum_label = ttk.Label(iso_frame, text="", font=('Arial', 9))
+        self.checksum_label.grid(row=1, column=1, sticky=tk.W, pady=(5, 0))
+        
         # USB Device Selection Section
         device_frame = ttk.LabelFrame(main_frame, text="USB Device Selection", padding="10")
         device_frame.grid(row=2, column=0, sticky=(tk.W, tk.E), pady=(0, 10))
@@ -140,6 +1483,20 @@ class BootableUSBCreator:
         label_entry = ttk.Entry(config_frame, textvariable=self.volume_label)
         label_entry.grid(row=3, column=1, sticky=(tk.W, tk.E))
         
+        # Multiboot
+        ttk.Label(config_frame, text="Multiboot:").grid(row=4, column=0, sticky=tk.W, padx=(0, 10), pady=5)
+        multiboot_frame = ttk.Frame(config_frame)
+        multiboot_frame.grid(row=4, column=1, sticky=tk.W)
+        ttk.Checkbutton(multiboot_frame, text="Add ISO to a GRUB multiboot stick (keeps existing ISOs)",
+                        variable=self.multiboot).pack(side=tk.LEFT, padx=(0, 20))
+        ttk.Button(multiboot_frame, text="Remove ISO...",
+                   command=self.manage_multiboot).pack(side=tk.LEFT)
+        
+        # Device check
+        ttk.Label(config_frame, text="Device Check:").grid(row=5, column=0, sticky=tk.W, padx=(0, 10), pady=5)
+        ttk.Checkbutton(config_frame, text="Test for fake capacity / bad flash before writing",
+                        variable=self.verify_capacity).grid(row=5, column=1, sticky=tk.W)
+        
         # Progress Section
         progress_frame = ttk.LabelFrame(main_frame, text="Progress", padding="10")
         progress_frame.grid(row=4, column=0, sticky=(tk.W, tk.E, tk.N, tk.S), pady=(0, 10))
@@ -268,6 +1625,96 @@ class BootableUSBCreator:
             clean_label = clean_label[:11]
             self.volume_label.set(clean_label)
             self.log(f"Auto-generated volume label: {clean_label}")
+            
+            self.start_iso_verification(filename)
+    
+    def start_iso_verification(self, iso_path: str):
+        """Hash the ISO in the background while the user configures options"""
+        if self.hash_cancel is not None:
+            self.hash_cancel.set()
+        self.hash_cancel = threading.Event()
+        self.iso_checksum_status = "pending"
+        self.checksum_label.config(text="SHA256: checking...", foreground='black')
+        
+        self.hash_thread = threading.Thread(target=self._verify_iso_thread, args=(iso_path, self.hash_cancel))
+        self.hash_thread.daemon = True
+        self.hash_thread.start()
+    
+    def _verify_iso_thread(self, iso_path: str, cancel: threading.Event):
+        """Thread function for hashing an ISO and matching it against vendor checksums"""
+        try:
+            expected = find_expected_sha256(iso_path)
+            digest = self.hash_cache.get(iso_path)
+            
+            if digest is None:
+                last_percent = [-1]
+                
+                def report(done, total):
+                    percent = done * 100 // total if total else 100
+                    if percent != last_percent[0] and not cancel.is_set():
+                        last_percent[0] = percent
+                        self.checksum_label.config(text=f"SHA256: hashing {percent}%...")
+                
+                digest = sha256_file(iso_path, cancel, report)
+                if digest is None:
+                    return
+                self.hash_cache.put(iso_path, digest)
+            
+            if cancel.is_set():
+                return
+            
+            if expected is None:
+                self.iso_checksum_status = "unverified"
+                self.checksum_label.config(text=f"SHA256: {digest} (no checksum file found)",
+                                           foreground='black')
+                self.log(f"ISO SHA256: {digest} (no SHA256SUMS or .sha256 file next to the ISO)")
+            elif expected[0] == digest:
+                self.iso_checksum_status = "match"
+                self.checksum_label.config(text=f"✓ SHA256 matches {os.path.basename(expected[1])}",
+                                           foreground='green')
+                self.log(f"ISO checksum verified against {expected[1]}", "SUCCESS")
+            else:
+                self.iso_checksum_status = "mismatch"
+                self.checksum_label.config(text=f"✗ SHA256 does NOT match {os.path.basename(expected[1])}",
+                                           foreground='red')
+                self.log(f"ISO checksum mismatch! Expected {expected[0]}, got {digest}", "ERROR")
+        
+        except OSError as e:
+            self.iso_checksum_status = "error"
+            self.checksum_label.config(text="SHA256: could not read ISO", foreground='orange')
+            self.log(f"Could not verify ISO checksum: {e}", "WARNING")
+    
+    def confirm_iso_checksum(self) -> bool:
+        """Let the user back out of flashing an ISO whose checksum did not match
+        
+        A hash still in progress is waited for, so a mismatch is caught before
+        anything is written and the copy does not compete with it for reads.
+        """
+        if self.iso_checksum_status == "pending" and self.hash_thread is not None:
+            import time
+            
+            self.log("Waiting for ISO checksum verification to finish...")
+            self.create_btn.config(state='disabled')
+            try:
+                # Keep the event loop running: the hash thread updates the checksum label
+                while self.hash_thread.is_alive():
+                    self.root.update()
+                    time.sleep(0.05)
+            except tk.TclError:
+                return False
+            self.create_btn.config(state='normal')
+            if self.iso_checksum_status == "pending":
+                self.log("ISO checksum verification did not complete; continuing unverified", "WARNING")
+        
+        if self.iso_checksum_status == "mismatch":
+            return messagebox.askyesno(
+                "Checksum Mismatch",
+                "The ISO's SHA256 does NOT match the vendor checksum file next to it.\n"
+                "The download may be corrupted or tampered with.\n\n"
+                "Continue anyway?",
+                icon='warning'
+            )
+        return True
     
     def refresh_devices(self):
         """Refresh the list of available USB devices"""
@@ -285,26 +1732,8 @@ class BootableUSBCreator:
     
     def get_usb_devices(self) -> List[USBDevice]:
         """Get list of USB storage devices"""
-        devices = []
         try:
-            # Use lsblk to get block devices
-            result = subprocess.run(
-                ['lsblk', '-J', '-o', 'NAME,SIZE,MODEL,TRAN,TYPE,MOUNTPOINT'],
-                capture_output=True, text=True, check=True
-            )
-            
-            data = json.loads(result.stdout)
-            
-            for device in data.get('blockdevices', []):
-                # Filter for USB devices
-                if device.get('tran') == 'usb' and device.get('type') == 'disk':
-                    dev_path = f"/dev/{device['name']}"
-                    size = device.get('size', 'Unknown')
-                    model = device.get('model', 'Unknown').strip()
-                    mountpoint = device.get('mountpoint', '')
-                    
-                    devices.append(USBDevice(dev_path, size, model, mountpoint))
-        
+            return scan_usb_devices()
         except subprocess.CalledProcessError as e:
             self.log(f"Error scanning devices: {e}", "ERROR")
         except json.JSONDecodeError as e:
@@ -312,7 +1741,7 @@ class BootableUSBCreator:
         except Exception as e:
             self.log(f"Unexpected error: {e}", "ERROR")
         
-        return devices
+        return []
     
     def run_command(self, cmd: List[str], description: str = "") -> bool:
         """Run a shell command and log output"""
@@ -343,6 +1772,86 @@ class BootableUSBCreator:
             self.log(f"Unexpected error: {e}", "ERROR")
             return False
     
+    def start_history_job(self, device: str, engine: str):
+        """Record a new job and log the time it is expected to take"""
+        import time
+        
+        usb = next((dev for dev in self.usb_devices if dev.device == device), None)
+        self.stage_started = time.time()
+        self.last_copy_bytes = None
+        try:
+            self.job_id = self.history.start_job(usb, self.selected_iso.get(), engine, self.file_system.get())
+            if usb is not None:
+                prediction = self.history.predict_duration(usb.model, engine,
+                                                           os.path.getsize(self.selected_iso.get()))
+                if prediction:
+                    self.log(f"Estimated time: {format_duration(prediction[0])} "
+                             f"(from {prediction[1]} previous run(s) on {usb.model})")
+        except (sqlite3.Error, OSError) as e:
+            self.job_id = None
+            self.log(f"Job history unavailable: {e}", "WARNING")
+    
+    def end_stage(self, name: str, data_bytes: Optional[int] = None):
+        """Record the duration of the stage that just finished"""
+        import time
+        
+        now = time.time()
+        if self.job_id is not None:
+            try:
+                self.history.record_stage(self.job_id, name, now - self.stage_started, data_bytes)
+            except sqlite3.Error as e:
+                self.log(f"Could not record stage in job history: {e}", "WARNING")
+        self.stage_started = now
+    
+    def finish_history_job(self, device: str, engine: str, status: str, error: str = ""):
+        """Record how the job ended and warn if the stick has slowed down over time"""
+        if self.job_id is None:
+            return
+        try:
+            self.history.finish_job(self.job_id, status, error)
+            usb = next((dev for dev in self.usb_devices if dev.device == device), None)
+            trend = self.history.throughput_trend(usb.serial, engine) if usb else None
+            if trend:
+                self.log(f"This stick wrote at {trend[0] / 1024**2:.1f} MB/s, down from "
+                         f"{trend[1] / 1024**2:.1f} MB/s on earlier runs - it may be wearing out", "WARNING")
+        except sqlite3.Error as e:
+            self.log(f"Could not record job history: {e}", "WARNING")
+        self.job_id = None
+    
+    def check_device_capacity(self, device: str) -> bool:
+        """Run the sampled fake-capacity test against a device; False flags a bad device"""
+        cmd = [sys.executable, os.path.abspath(__file__), '--check-capacity', device, '--json']
+        if os.geteuid() != 0:
+            cmd = ['sudo'] + cmd
+        
+        self.log("Testing for fake capacity and bad flash (sampled write/read-back)...")
+        result = subprocess.run(cmd, capture_output=True, text=True)
+        try:
+            report = json.loads(result.stdout)
+        except ValueError:
+            self.log(f"Capacity test could not run: {result.stderr.strip()}", "ERROR")
+            return False
+        
+        if 'error' in report:
+            self.log(f"Capacity test could not run: {report['error']}", "ERROR")
+            return False
+        
+        reported_gb = report['reported_size'] / 1024**3
+        if report['ok']:
+            self.log(f"Capacity test passed: {report['samples']} samples across {reported_gb:.2f} GB "
+                     f"in {report['elapsed']}s", "SUCCESS")
+            return True
+        
+        if report['wrap_size'] is not None:
+            self.log(f"Capacity test FAILED: writes wrap around to the start of the device. Device reports "
+                     f"{reported_gb:.2f} GB but holds only {report['wrap_size'] / 1024**3:.2f} GB "
+                     f"- counterfeit.", "ERROR")
+            return False
+        self.log(f"Capacity test FAILED: {report['bad_samples']} of {report['samples']} samples did not "
+                 f"read back. Device reports {reported_gb:.2f} GB but holds at most "
+                 f"{report['usable_size'] / 1024**3:.2f} GB - likely counterfeit or failing flash.", "ERROR")
+        return False
+    
     def unmount_device(self, device: str) -> bool:
         """Unmount all partitions of a device"""
         try:
@@ -369,10 +1878,52 @@ class BootableUSBCreator:
             self.log(f"Error unmounting device: {e}", "WARNING")
             return False
     
-    def copy_with_progress(self, source: str, destination: str) -> bool:
-        """Copy files from source to destination with progress tracking (30-90%)"""
+    def get_partition_path(self, device: str, number: int) -> str:
+        """Return the device node of a partition on the given device"""
+        # NVMe devices: /dev/nvme0n1 -> /dev/nvme0n1p1
+        # MMC/SD cards: /dev/mmcblk0 -> /dev/mmcblk0p1
+        # Regular USB: /dev/sdb -> /dev/sdb1
+        if 'nvme' in device or 'mmcblk' in device or 'loop' in device:
+            return f"{device}p{number}"
+        return f"{device}{number}"
+    
+    def wait_for_partition(self, partition: str):
+        """Wait for a newly created partition node to appear"""
+        import time
+        
+        # Verify partition exists (retry up to 5 times)
+        for retry in range(5):
+            if os.path.exists(partition):
+                self.log(f"Partition {partition} detected")
+                return
+            self.log(f"Waiting for partition {partition} (attempt {retry + 1}/5)...")
+            time.sleep(1)
+        raise Exception(f"Partition {partition} not found after creation. Device may need manual intervention.")
+    
+    def format_partition(self, partition: str, fs: str, label: str) -> bool:
+        """Format a partition with the given file system"""
+        if fs in ("FAT32", "exFAT"):
+            # Built-in formatter, run privileged through our own command line entry
+            cmd = [sys.executable, os.path.abspath(__file__), '--format', partition,
+                   '--fs', fs, '--label', label]
+            if os.geteuid() != 0:
+                cmd = ['sudo'] + cmd
+            return self.run_command(cmd, f"Formatting as {fs}...")
+        if fs == "NTFS":
+            return self.run_command(
+                ['sudo', 'mkfs.ntfs', '-Q', '-L', label, partition],
+                "Formatting as NTFS (quick format)..."
+            )
+        self.log(f"Unsupported file system: {fs}", "ERROR")
+        return False
+    
+    def copy_with_progress(self, source: str, destination: str, keep_owner: bool = True) -> bool:
+        """Copy a directory's contents or a single file to destination with progress tracking (30-90%)
+        
+        keep_owner=False skips ownership and permissions, which FAT and exFAT cannot store:
+        chowning a user's file onto them fails with EPERM and rsync exits with code 23.
+        """
         try:
-            import re
             import time
             
             # First, get total size to copy
@@ -383,10 +1934,16 @@ class BootableUSBCreator:
             )
             total_size = int(result.stdout.split()[0])
             self.log(f"Total size to copy: {total_size / (1024**3):.2f} GB")
+            self.last_copy_bytes = total_size
+            
+            # Copy the contents of a directory, or a single file into destination
+            rsync_source = f"{source}/" if os.path.isdir(source) else source
+            
+            attributes = [] if keep_owner else ['--no-owner', '--no-group', '--no-perms']
             
             # Start rsync with progress
             process = subprocess.Popen(
-                ['sudo', 'rsync', '-ah', '--info=progress2', f"{source}/", destination],
+                ['sudo', 'rsync', '-ah', *attributes, '--info=progress2', rsync_source, destination],
                 stdout=subprocess.PIPE,
                 stderr=subprocess.PIPE,
                 text=True,
@@ -454,6 +2011,13 @@ class BootableUSBCreator:
         
         device = self.usb_devices[device_index].device
         
+        if not self.confirm_iso_checksum():
+            return
+        
+        if self.multiboot.get():
+            self.start_multiboot(device)
+            return
+        
         # Confirmation
         confirm = messagebox.askyesno(
             "Confirm",
@@ -488,11 +2052,18 @@ class BootableUSBCreator:
             self.log("Starting bootable USB creation process...", "INFO")
             self.log(f"Target device: {device}", "INFO")
             self.log("=" * 50, "INFO")
+            self.start_history_job(device, "file-copy")
             
             # Step 1: Unmount device (0-5%)
             self.update_progress(0, "Step 1/6: Unmounting device...")
             self.log("\n[Step 1/6] Unmounting device...")
             self.unmount_device(device)
+            self.end_stage("unmount")
+            if self.verify_capacity.get():
+                passed = self.check_device_capacity(device)
+                self.end_stage("capacity-check")
+                if not passed:
+                    raise Exception("Device failed the capacity test and was not written")
             self.update_progress(5, "Step 1/6: Complete")
             
             # Step 2: Wipe device (5-10%)
@@ -503,6 +2074,7 @@ class BootableUSBCreator:
                 "Removing existing file system signatures..."
             ):
                 raise Exception("Failed to wipe device")
+            self.end_stage("wipe")
             self.update_progress(10, "Step 2/6: Complete")
             
             # Step 3: Create partition table (10-20%)
@@ -558,54 +2130,19 @@ class BootableUSBCreator:
             import time
             time.sleep(3)  # Increased wait time for Ubuntu
             
-            # Determine partition name (handle different device types)
-            # NVMe devices: /dev/nvme0n1 -> /dev/nvme0n1p1
-            # MMC/SD cards: /dev/mmcblk0 -> /dev/mmcblk0p1
-            # Regular USB: /dev/sdb -> /dev/sdb1
-            if 'nvme' in device or 'mmcblk' in device or 'loop' in device:
-                partition = f"{device}p1"
-            else:
-                partition = f"{device}1"
-            
-            # Verify partition exists (retry up to 5 times)
-            for retry in range(5):
-                if os.path.exists(partition):
-                    self.log(f"Partition {partition} detected")
-                    break
-                self.log(f"Waiting for partition {partition} (attempt {retry + 1}/5)...")
-                time.sleep(1)
-            else:
-                raise Exception(f"Partition {partition} not found after creation. Device may need manual intervention.")
+            partition = self.get_partition_path(device, 1)
+            self.wait_for_partition(partition)
             
+            self.end_stage("partition")
             self.update_progress(20, "Step 3/6: Complete")
             
             # Step 4: Format partition (20-30%)
             self.update_progress(20, "Step 4/6: Formatting partition...")
             self.log(f"\n[Step 4/6] Formatting partition {partition}...")
-            fs = self.file_system.get()
-            label = self.volume_label.get()
-            
-            if fs == "FAT32":
-                if not self.run_command(
-                    ['sudo', 'mkfs.vfat', '-F', '32', '-n', label, partition],
-                    f"Formatting as FAT32..."
-                ):
-                    raise Exception("Failed to format partition")
-            elif fs == "NTFS":
-                if not self.run_command(
-                    ['sudo', 'mkfs.ntfs', '-Q', '-L', label, partition],
-                    f"Formatting as NTFS (quick format)..."
-                ):
-                    raise Exception("Failed to format partition")
-            elif fs == "exFAT":
-                # Try mkfs.exfat first (exfatprogs), fall back to mkexfatfs (exfat-utils)
-                exfat_cmd = 'mkfs.exfat' if subprocess.run(['which', 'mkfs.exfat'], capture_output=True).returncode == 0 else 'mkexfatfs'
-                if not self.run_command(
-                    ['sudo', exfat_cmd, '-n', label, partition],
-                    f"Formatting as exFAT..."
-                ):
-                    raise Exception("Failed to format partition")
+            if not self.format_partition(partition, self.file_system.get(), self.volume_label.get()):
+                raise Exception("Failed to format partition")
             
+            self.end_stage("format")
             self.update_progress(30, "Step 4/6: Complete")
             
             # Step 5: Mount and copy ISO contents (30-90%)
@@ -656,6 +2193,8 @@ class BootableUSBCreator:
                         break
                     time.sleep(1)
             
+            self.end_stage("copy", self.last_copy_bytes)
+            
             # Step 6: Install bootloader (90-95%)
             self.update_progress(90, "Step 6/6: Installing bootloader...")
             self.log("\n[Step 6/6] Installing bootloader...")
@@ -704,12 +2243,15 @@ class BootableUSBCreator:
                 except:
                     pass
             
+            self.end_stage("bootloader")
             self.update_progress(95, "Step 6/6: Complete")
             
             # Sync and finalize (95-100%)
             self.update_progress(95, "Finalizing: Syncing data to disk...")
             self.log("\nSyncing data to disk...")
             subprocess.run(['sync'], check=False)
+            self.end_stage("sync")
+            self.finish_history_job(device, "file-copy", "success")
             self.update_progress(100, "Complete!")
             
             self.log("=" * 50, "SUCCESS")
@@ -725,6 +2267,7 @@ class BootableUSBCreator:
         except Exception as e:
             self.log(f"\nFailed to create bootable USB: {e}", "ERROR")
             self.log(f"Error type: {type(e).__name__}", "ERROR")
+            self.finish_history_job(device, "file-copy", "failed", str(e))
             import traceback
             self.log(f"Traceback: {traceback.format_exc()}", "ERROR")
             messagebox.showerror("Error", f"Failed to create bootable USB:\n{e}")
@@ -734,11 +2277,408 @@ class BootableUSBCreator:
             self.is_creating = False
             self.log("Thread finished", "INFO")
 
+    
+    def get_partitions(self, device: str) -> List[Dict]:
+        """Get the partitions of a device with their labels and file systems"""
+        result = subprocess.run(
+            ['lsblk', '-J', '-o', 'NAME,LABEL,FSTYPE', device],
+            capture_output=True, text=True, check=True
+        )
+        data = json.loads(result.stdout)
+        partitions = []
+        for dev in data.get('blockdevices', []):
+            partitions.extend(dev.get('children', []))
+        return partitions
+    
+    def is_multiboot_stick(self, device: str) -> bool:
+        """Check whether a device already carries the multiboot layout"""
+        try:
+            partitions = self.get_partitions(device)
+        except (subprocess.CalledProcessError, json.JSONDecodeError):
+            return False
+        return any(part.get('label') == MULTIBOOT_ESP_LABEL for part in partitions)
+    
+    def write_root_file(self, path: str, content: str) -> bool:
+        """Write a text file onto a root-owned mount"""
+        import tempfile
+        
+        with tempfile.NamedTemporaryFile('w', suffix='.tmp', delete=False) as tmp:
+            tmp.write(content)
+        try:
+            return self.run_command(['sudo', 'cp', tmp.name, path])
+        finally:
+            os.unlink(tmp.name)
+    
+    def load_multiboot_manifest(self, usb_mount: str) -> List[Dict]:
+        """Read the list of ISOs on a mounted multiboot data partition"""
+        manifest = os.path.join(usb_mount, MULTIBOOT_MANIFEST)
+        if not os.path.exists(manifest):
+            return []
+        with open(manifest) as f:
+            return json.load(f).get('isos', [])
+    
+    def save_multiboot_manifest(self, usb_mount: str, entries: List[Dict]) -> bool:
+        """Write the ISO list and regenerate the GRUB menu on a mounted data partition"""
+        self.run_command(['sudo', 'mkdir', '-p', os.path.join(usb_mount, MULTIBOOT_DIR)])
+        manifest = json.dumps({'isos': entries}, indent=2)
+        return (self.write_root_file(os.path.join(usb_mount, MULTIBOOT_MANIFEST), manifest) and
+                self.write_root_file(os.path.join(usb_mount, MULTIBOOT_GRUB_CFG),
+                                     build_multiboot_grub_cfg(entries)))
+    
+    def probe_multiboot_entry(self, iso_path: str, iso_mount: str) -> Optional[Dict]:
+        """Work out how GRUB should boot an ISO stored as a file on the stick"""
+        os.makedirs(iso_mount, exist_ok=True)
+        if not self.run_command(
+            ['sudo', 'mount', '-o', 'loop,ro', iso_path, iso_mount],
+            "Inspecting ISO boot layout..."
+        ):
+            return None
+        
+        try:
+            def has(rel_path):
+                return os.path.exists(os.path.join(iso_mount, rel_path.lstrip('/')))
+            
+            entry = {'file': multiboot_iso_filename(iso_path), 'title': Path(iso_path).stem,
+                     'size': os.path.getsize(iso_path)}
+            
+            if has('/boot/grub/loopback.cfg'):
+                entry['kind'] = 'loopback'
+                return entry
+            
+            for kernel, initrd, args in MULTIBOOT_KERNEL_LAYOUTS:
+                if has(kernel) and has(initrd):
+                    entry.update(kind='kernel', kernel=kernel, initrd=initrd, args=args)
+                    return entry
+            
+            if has('/sources/boot.wim') or has('/bootmgr'):
+                self.log("Windows installer ISOs cannot be booted from an ISO file by GRUB. "
+                         "Use a regular (non-multiboot) USB for Windows.", "ERROR")
+            else:
+                self.log("No supported boot layout found in this ISO", "ERROR")
+            return None
+        
+        finally:
+            subprocess.run(['sudo', 'umount', iso_mount], capture_output=True, check=False)
+    
+    def start_multiboot(self, device: str):
+        """Confirm and start adding the selected ISO to a multiboot stick"""
+        iso_name = os.path.basename(self.selected_iso.get())
+        initialize = not self.is_multiboot_stick(device)
+        
+        if initialize:
+            confirm = messagebox.askyesno(
+                "Confirm",
+                f"{device} is not a multiboot stick yet.\n\n"
+                f"This will ERASE ALL DATA on {device} and set up a GRUB multiboot layout "
+                f"({self.partition_scheme.get()}, {self.file_system.get()}), then add:\n"
+                f"{iso_name}\n\n"
+                "Are you sure you want to continue?"
+            )
+        else:
+            confirm = messagebox.askyesno(
+                "Confirm",
+                f"Add {iso_name} to the multiboot stick {device}?\n\n"
+                "Existing ISOs are kept; an ISO with the same name is replaced."
+            )
+        
+        if not confirm:
+            return
+        
+        self.is_creating = True
+        self.create_btn.config(state='disabled')
+        self.reset_progress()
+        
+        thread = threading.Thread(target=self._multiboot_add_thread, args=(device, initialize))
+        thread.daemon = True
+        thread.start()
+    
+    def setup_multiboot_layout(self, device: str):
+        """Partition, format and install GRUB on a new multiboot stick (0-30%)"""
+        import time
+        
+        self.update_progress(0, "Multiboot setup: Unmounting device...")
+        self.log("\n[Setup] Preparing multiboot layout...")
+        self.unmount_device(device)
+        self.end_stage("unmount")
+        if self.verify_capacity.get():
+            passed = self.check_device_capacity(device)
+            self.end_stage("capacity-check")
+            if not passed:
+                raise Exception("Device failed the capacity test and was not written")
+        
+        if not self.run_command(
+            ['sudo', 'wipefs', '--all', device],
+            "Removing existing file system signatures..."
+        ):
+            raise Exception("Failed to wipe device")
+        self.update_progress(5, "Multiboot setup: Partitioning...")
+        
+        fs = self.file_system.get()
+        data_fs_type = 'fat32' if fs == 'FAT32' else 'ntfs'
+        if self.partition_scheme.get() == "GPT":
+            commands = [
+                ['sudo', 'parted', '-s', device, 'mklabel', 'gpt'],
+                ['sudo', 'parted', '-s', device, 'mkpart', 'primary', 'fat32', '1MiB', MULTIBOOT_ESP_SIZE],
+                ['sudo', 'parted', '-s', device, 'set', '1', 'esp', 'on'],
+            ]
+        else:
+            commands = [
+                ['sudo', 'parted', '-s', device, 'mklabel', 'msdos'],
+                ['sudo', 'parted', '-s', device, 'mkpart', 'primary', 'fat32', '1MiB', MULTIBOOT_ESP_SIZE],
+                ['sudo', 'parted', '-s', device, 'set', '1', 'boot', 'on'],
+            ]
+        commands.append(['sudo', 'parted', '-s', device, 'mkpart', 'primary', data_fs_type,
+                         MULTIBOOT_ESP_SIZE, '100%'])
+        for cmd in commands:
+            if not self.run_command(cmd):
+                raise Exception("Failed to create multiboot partitions")
+        
+        subprocess.run(['sudo', 'partprobe', device], capture_output=True, text=True)
+        time.sleep(3)
+        esp = self.get_partition_path(device, 1)
+        data = self.get_partition_path(device, 2)
+        self.wait_for_partition(esp)
+        self.wait_for_partition(data)
+        self.update_progress(10, "Multiboot setup: Formatting...")
+        
+        if not self.format_partition(esp, "FAT32", MULTIBOOT_ESP_LABEL):
+            raise Exception("Failed to format boot partition")
+        if not self.format_partition(data, fs, self.volume_label.get()):
+            raise Exception("Failed to format data partition")
+        self.update_progress(20, "Multiboot setup: Installing GRUB...")
+        
+        esp_mount = "/tmp/bootable_esp_mount"
+        os.makedirs(esp_mount, exist_ok=True)
+        if not self.run_command(['sudo', 'mount', esp, esp_mount], "Mounting boot partition..."):
+            raise Exception(f"Failed to mount boot partition: {esp}")
+        
+        try:
+            boot_dir = os.path.join(esp_mount, 'boot')
+            if not self.run_command(
+                ['sudo', 'grub-install', '--target=x86_64-efi', '--removable', '--no-nvram',
+                 f'--efi-directory={esp_mount}', f'--boot-directory={boot_dir}', device],
+                "Installing GRUB for UEFI..."
+            ):
+                raise Exception("Failed to install GRUB for UEFI")
+            
+            if self.partition_scheme.get() == "MBR":
+                if not self.run_command(
+                    ['sudo', 'grub-install', '--target=i386-pc', f'--boot-directory={boot_dir}', device],
+                    "Installing GRUB for Legacy BIOS..."
+                ):
+                    self.log("Legacy BIOS GRUB installation failed, stick will boot in UEFI mode only",
+                             "WARNING")
+            else:
+                self.log("GPT layout: stick boots in UEFI mode (choose MBR for Legacy BIOS as well)")
+            
+            self.run_command(['sudo', 'mkdir', '-p', os.path.join(boot_dir, 'grub')])
+            if not self.write_root_file(os.path.join(boot_dir, 'grub', 'grub.cfg'), MULTIBOOT_GRUB_STUB):
+                raise Exception("Failed to write GRUB configuration")
+        
+        finally:
+            subprocess.run(['sudo', 'umount', esp_mount], capture_output=True, check=False)
+        
+        self.update_progress(30, "Multiboot setup: Complete")
+    
+    def _multiboot_add_thread(self, device: str, initialize: bool):
+        """Thread function for adding an ISO to a multiboot stick"""
+        iso_path = self.selected_iso.get()
+        iso_mount = "/tmp/bootable_iso_mount"
+        usb_mount = "/tmp/bootable_usb_mount"
+        
+        try:
+            self.log("=" * 50, "INFO")
+            self.log(f"Adding {os.path.basename(iso_path)} to multiboot stick {device}", "INFO")
+            self.log("=" * 50, "INFO")
+            self.start_history_job(device, "multiboot")
+            
+            entry = self.probe_multiboot_entry(iso_path, iso_mount)
+            if entry is None:
+                raise Exception("This ISO cannot be added to a multiboot stick")
+            
+            if initialize:
+                data_is_fat32 = self.file_system.get() == "FAT32"
+            else:
+                data_is_fat32 = any(part.get('fstype') == 'vfat' and part.get('label') != MULTIBOOT_ESP_LABEL
+                                    for part in self.get_partitions(device))
+            if entry['size'] >= 4 * 1024**3 and data_is_fat32:
+                raise Exception("ISO is larger than 4GB, which FAT32 cannot store. Choose exFAT or NTFS.")
+            
+            if initialize:
+                self.setup_multiboot_layout(device)
+            else:
+                self.unmount_device(device)
+            self.end_stage("setup" if initialize else "unmount")
+            
+            data = self.get_partition_path(device, 2)
+            os.makedirs(usb_mount, exist_ok=True)
+            if not self.run_command(['sudo', 'mount', data, usb_mount], "Mounting data partition..."):
+                raise Exception(f"Failed to mount multiboot data partition: {data}")
+            
+            try:
+                entries = self.load_multiboot_manifest(usb_mount)
+                iso_dir = os.path.join(usb_mount, MULTIBOOT_ISO_DIR)
+                target = os.path.join(iso_dir, entry['file'])
+                
+                import shutil
+                previous = [e for e in entries if e['file'] == entry['file']]
+                old_size = os.path.getsize(target) if previous and os.path.exists(target) else 0
+                others = [e for e in entries if e['file'] != entry['file']]
+                
+                free = shutil.disk_usage(usb_mount).free
+                if entry['size'] > free + old_size:
+                    raise Exception(f"Not enough free space on stick: {entry['size'] / 1024**3:.2f} GB "
+                                    f"needed, {(free + old_size) / 1024**3:.2f} GB free")
+                
+                self.run_command(['sudo', 'mkdir', '-p', iso_dir])
+                if entry['size'] <= free:
+                    # Copy beside the old ISO and swap it in, so a failed copy leaves it bootable
+                    copy_target = f"{target}.part"
+                else:
+                    # Only fits once the old ISO is gone (entry['size'] > free implies there
+                    # is one): drop it from the menu first so it never points at a missing file
+                    self.log(f"Not enough space to keep the old {entry['file']} during the copy; removing it first",
+                             "WARNING")
+                    copy_target = target
+                    if not self.save_multiboot_manifest(usb_mount, others):
+                        raise Exception("Failed to update multiboot menu")
+                    self.run_command(['sudo', 'rm', '-f', target])
+                
+                if previous:
+                    self.log(f"Replacing existing {entry['file']}")
+                self.update_progress(30, "Copying ISO file...")
+                # The ISO belongs to the user, not root, so its owner cannot be kept on FAT/exFAT
+                if not self.copy_with_progress(iso_path, copy_target, keep_owner=False):
+                    subprocess.run(['sudo', 'rm', '-f', copy_target], capture_output=True, check=False)
+                    raise Exception("Failed to copy ISO file")
+                if copy_target != target and not self.run_command(['sudo', 'mv', '-f', copy_target, target]):
+                    raise Exception(f"Failed to move {entry['file']} into place")
+                self.end_stage("copy", self.last_copy_bytes)
+                entries = others
+                
+                self.update_progress(90, "Updating boot menu...")
+                entries.append(entry)
+                entries.sort(key=lambda e: e['title'].lower())
+                if not self.save_multiboot_manifest(usb_mount, entries):
+                    raise Exception("Failed to update multiboot menu")
+                self.log(f"Boot menu now lists {len(entries)} ISO(s)")
+            
+            finally:
+                subprocess.run(['sudo', 'umount', usb_mount], capture_output=True, check=False)
+            
+            self.update_progress(95, "Finalizing: Syncing data to disk...")
+            subprocess.run(['sync'], check=False)
+            self.end_stage("menu")
+            self.finish_history_job(device, "multiboot", "success")
+            self.update_progress(100, "Complete!")
+            self.log(f"{entry['file']} added to multiboot stick", "SUCCESS")
+            self.show_finish_button()
+            messagebox.showinfo("Success", f"{entry['file']} added to the multiboot stick.")
+        
+        except Exception as e:
+            self.log(f"\nFailed to update multiboot stick: {e}", "ERROR")
+            self.finish_history_job(device, "multiboot", "failed", str(e))
+            messagebox.showerror("Error", f"Failed to update multiboot stick:\n{e}")
+            self.create_btn.config(state='normal')
+        
+        finally:
+            self.is_creating = False
+    
+    def manage_multiboot(self):
+        """Show the ISOs on the selected multiboot stick and offer to remove them"""
+        if self.is_creating:
+            messagebox.showwarning("In Progress", "A USB creation is already in progress!")
+            return
+        
+        device_index = self.device_combo.current()
+        if device_index < 0 or device_index >= len(self.usb_devices):
+            messagebox.showerror("Error", "Please select a USB device!")
+            return
+        device = self.usb_devices[device_index].device
+        
+        if not self.is_multiboot_stick(device):
+            messagebox.showinfo("Multiboot", f"{device} is not a multiboot stick.")
+            return
+        
+        usb_mount = "/tmp/bootable_usb_mount"
+        os.makedirs(usb_mount, exist_ok=True)
+        self.unmount_device(device)
+        if not self.run_command(['sudo', 'mount', '-o', 'ro', self.get_partition_path(device, 2), usb_mount]):
+            messagebox.showerror("Error", "Failed to mount multiboot data partition!")
+            return
+        try:
+            entries = self.load_multiboot_manifest(usb_mount)
+        finally:
+            subprocess.run(['sudo', 'umount', usb_mount], capture_output=True, check=False)
+        
+        dialog = tk.Toplevel(self.root)
+        dialog.title(f"Multiboot ISOs on {device}")
+        dialog.transient(self.root)
+        
+        listbox = tk.Listbox(dialog, width=60, height=10)
+        listbox.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
+        for entry in entries:
+            listbox.insert(tk.END, f"{entry['file']} ({entry.get('size', 0) / 1024**3:.2f} GB)")
+        
+        def remove_selected():
+            selection = listbox.curselection()
+            if not selection:
+                return
+            entry = entries[selection[0]]
+            if not messagebox.askyesno("Confirm", f"Remove {entry['file']} from {device}?", parent=dialog):
+                return
+            dialog.destroy()
+            self.is_creating = True
+            self.create_btn.config(state='disabled')
+            self.reset_progress()
+            thread = threading.Thread(target=self._multiboot_remove_thread, args=(device, entry['file']))
+            thread.daemon = True
+            thread.start()
+        
+        button_frame = ttk.Frame(dialog)
+        button_frame.pack(pady=(0, 10))
+        ttk.Button(button_frame, text="Remove", command=remove_selected).pack(side=tk.LEFT, padx=5)
+        ttk.Button(button_frame, text="Close", command=dialog.destroy).pack(side=tk.LEFT, padx=5)
+    
+    def _multiboot_remove_thread(self, device: str, iso_file: str):
+        """Thread function for removing an ISO from a multiboot stick"""
+        usb_mount = "/tmp/bootable_usb_mount"
+        try:
+            self.update_progress(10, f"Removing {iso_file}...")
+            if not self.run_command(['sudo', 'mount', self.get_partition_path(device, 2), usb_mount],
+                                    "Mounting data partition..."):
+                raise Exception("Failed to mount multiboot data partition")
+            
+            try:
+                # Drop the menu entry before the file, so the menu never points at a missing ISO
+                entries = [e for e in self.load_multiboot_manifest(usb_mount) if e['file'] != iso_file]
+                self.update_progress(30, "Updating boot menu...")
+                if not self.save_multiboot_manifest(usb_mount, entries):
+                    raise Exception("Failed to update multiboot menu")
+                self.update_progress(60, f"Deleting {iso_file}...")
+                if not self.run_command(['sudo', 'rm', '-f',
+                                         os.path.join(usb_mount, MULTIBOOT_ISO_DIR, iso_file)]):
+                    raise Exception(f"Failed to delete {iso_file}")
+            finally:
+                subprocess.run(['sudo', 'umount', usb_mount], capture_output=True, check=False)
+            
+            subprocess.run(['sync'], check=False)
+            self.update_progress(100, "Complete!")
+            self.log(f"{iso_file} removed from multiboot stick", "SUCCESS")
+        
+        except Exception as e:
+            self.log(f"Failed to remove ISO: {e}", "ERROR")
+            messagebox.showerror("Error", f"Failed to remove ISO:\n{e}")
+        
+        finally:
+            self.is_creating = False
+            self.create_btn.config(state='normal')
+
 
 def check_dependencies():
     """Check if required system tools are available"""
-    required_tools = ['lsblk', 'parted', 'mkfs.vfat', 'rsync', 'wipefs', 'partprobe']
-    optional_tools = ['mkfs.ntfs', 'mkfs.exfat', 'grub-install']
+    required_tools = ['lsblk', 'parted', 'rsync', 'wipefs', 'partprobe']
+    optional_tools = ['mkfs.ntfs', 'grub-install']
     
     missing_required = []
     missing_optional = []
@@ -755,25 +2695,142 @@ def check_dependencies():
         print("ERROR: Missing required tools:")
         print("  " + ", ".join(missing_required))
         print("\nPlease install them using your package manager:")
-        print("  Ubuntu/Debian: sudo apt install parted dosfstools rsync util-linux")
-        print("  Fedora: sudo dnf install parted dosfstools rsync util-linux")
-        print("  Arch: sudo pacman -S parted dosfstools rsync util-linux")
+        print("  Ubuntu/Debian: sudo apt install parted rsync util-linux")
+        print("  Fedora: sudo dnf install parted rsync util-linux")
+        print("  Arch: sudo pacman -S parted rsync util-linux")
         return False
     
     if missing_optional:
         print("WARNING: Missing optional tools (some features may not work):")
         print("  " + ", ".join(missing_optional))
         print("\nTo enable all features, install:")
-        print("  Ubuntu/Debian: sudo apt install ntfs-3g exfatprogs grub2-common")
-        print("  Fedora: sudo dnf install ntfs-3g exfatprogs grub2-tools")
-        print("  Arch: sudo pacman -S ntfs-3g exfatprogs grub")
+        print("  Ubuntu/Debian: sudo apt install ntfs-3g grub2-common")
+        print("  Fedora: sudo dnf install ntfs-3g grub2-tools")
+        print("  Arch: sudo pacman -S ntfs-3g grub")
         print()
     
     return True
 
 
+def run_capacity_check(path: str, as_json: bool) -> int:
+    """Command line entry for the fake-capacity probe; exit status 2 flags a bad device"""
+    try:
+        result = check_capacity(path)
+    except (OSError, ValueError) as e:
+        if as_json:
+            print(json.dumps({'path': path, 'error': str(e)}))
+        else:
+            print(f"ERROR: Cannot test {path}: {e}")
+        return 1
+    
+    if as_json:
+        print(json.dumps(result.to_dict()))
+    else:
+        print(f"Tested {result.samples} samples across {result.reported_size / 1024**3:.2f} GB "
+              f"of {path} in {result.elapsed:.1f}s")
+        if result.ok:
+            print("OK: all samples read back intact")
+        elif result.wrap_size is not None:
+            print(f"BAD: writes wrap around at {result.wrap_size / 1024**3:.2f} GB, "
+                  f"which is the real capacity")
+        else:
+            print(f"BAD: {len(result.bad_offsets)} samples failed; "
+                  f"real capacity is at most {result.usable_size / 1024**3:.2f} GB")
+    return 0 if result.ok else 2
+
+
+def run_format(path: str, fs: str, label: str) -> int:
+    """Command line entry for the built-in FAT32/exFAT formatter"""
+    formatter = format_fat32 if fs == "FAT32" else format_exfat
+    try:
+        layout = formatter(path, label)
+    except (OSError, ValueError) as e:
+        print(f"ERROR: Cannot format {path} as {fs}: {e}", file=sys.stderr)
+        return 1
+    
+    print(f"{path}: {fs}, {layout['clusters']} clusters of {layout['cluster_size'] // 1024}KB, "
+          f"FAT at {layout['fat_offset']}, data at {layout['data_offset']} "
+          f"(aligned to {layout['alignment'] // 1024}KB)")
+    return 0
+
+
+def run_report() -> int:
+    """Command line entry summarising the job history"""
+    history = JobHistory()
+    try:
+        rows = history.report()
+        degraded = history.degraded_sticks()
+    except sqlite3.Error as e:
+        print(f"ERROR: Cannot read job history {history.path}: {e}")
+        return 1
+    
+    if not rows:
+        print(f"No jobs recorded yet in {history.path}")
+        return 0
+    
+    def mbps(rate):
+        return f"{rate / 1024**2:.1f}" if rate else "-"
+    
+    print(f"{'Model':<28} {'Engine':<10} {'Jobs':>5} {'OK':>5} {'Avg MB/s':>9} {'Min MB/s':>9} {'Max MB/s':>9}")
+    for model, engine, jobs, ok, avg, low, high in rows:
+        print(f"{model[:28]:<28} {engine:<10} {jobs:>5} {ok or 0:>5} {mbps(avg):>9} {mbps(low):>9} {mbps(high):>9}")
+    
+    if degraded:
+        print("\nSticks whose write speed has degraded:")
+        for serial, model, engine, latest, baseline in degraded:
+            print(f"  {serial} ({model}, {engine}): {mbps(latest)} MB/s, was {mbps(baseline)} MB/s")
+    return 0
+
+
+def run_duplicator(image: str, verify_capacity: bool, max_writers: int) -> int:
+    """Command line entry for the hotplug duplicator station"""
+    if os.geteuid() != 0:
+        print("ERROR: Duplicator mode writes to devices directly; run it with sudo.")
+        return 1
+    if not os.path.isfile(image):
+        print(f"ERROR: Image not found: {image}")
+        return 1
+    
+    return 0 if DuplicatorStation(image, verify_capacity, max_writers).run() else 1
+
+
 def main():
     """Main entry point"""
+    import argparse
+    
+    parser = argparse.ArgumentParser(description="Create bootable USB drives")
+    parser.add_argument('--check-capacity', metavar='PATH',
+                        help="test a device or image file for fake capacity/bad flash "
+                             "(overwrites sampled blocks) and exit")
+    parser.add_argument('--json', action='store_true', help="print machine-readable results")
+    parser.add_argument('--format', metavar='PATH',
+                        help="create a FAT32 or exFAT file system on a partition or image file and exit")
+    parser.add_argument('--fs', choices=['FAT32', 'exFAT'], default='FAT32',
+                        help="format: file system to create (default FAT32)")
+    parser.add_argument('--label', default="", help="format: volume label")
+    parser.add_argument('--duplicator', metavar='IMAGE',
+                        help="headless duplicator station: write IMAGE to every USB stick "
+                             "inserted from now on")
+    parser.add_argument('--no-capacity-check', action='store_true',
+                        help="duplicator: skip the fake-capacity test before writing")
+    parser.add_argument('--max-writers-per-controller', type=int, default=DUPLICATOR_MAX_WRITERS_PER_CONTROLLER,
+                        metavar='N', help="duplicator: upper bound on concurrent writers per USB controller")
+    parser.add_argument('--report', action='store_true',
+                        help="summarise recorded jobs by device model and engine and exit")
+    args = parser.parse_args()
+    
+    if args.report:
+        sys.exit(run_report())
+    
+    if args.check_capacity:
+        sys.exit(run_capacity_check(args.check_capacity, args.json))
+    
+    if args.format:
+        sys.exit(run_format(args.format, args.fs, args.label))
+    
+    if args.duplicator:
+        sys.exit(run_duplicator(args.duplicator, not args.no_capacity_check, args.max_writers_per_controller))
+    
     print("Bootable USB Creator")
     print("=" * 50)
     